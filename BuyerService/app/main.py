@@ -1,9 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Response
 import sqlite3
 import os
+from typing import Optional
 from app.models import BuyerCreate, BuyerResponse
+from app.concurrency import limit_concurrency
+from app.conditional import cache_headers, ensure_row_version, etag_matches, entity_tag, not_modified
+from app.db import Database
+from app.debug import add_debug_routes
+from app.metrics import instrument_app, track_dependency, slow_log
+from app.tracing import init_tracing, trace_requests
 
-app = FastAPI(title="Buyer Service")
+db = Database('buyers.db')
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await db.close()
+
+app = FastAPI(title="Buyer Service", lifespan=lifespan)
+limit_concurrency(app)
+instrument_app(app)
+add_debug_routes(app, slow_log)
+trace_requests(app)
+init_tracing('buyer-service')
 
 # db startup
 def init_db():
@@ -19,6 +39,7 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    ensure_row_version(conn, 'buyers', ['name', 'ssn', 'email', 'phoneNumber'])
     conn.commit()
     conn.close()
 
@@ -26,37 +47,38 @@ def init_db():
 init_db()
 
 @app.post("/buyers", status_code=201)
-def create_buyer(buyer: BuyerCreate):
-    conn = sqlite3.connect('buyers.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO buyers (name, ssn, email, phoneNumber)
-        VALUES (?, ?, ?, ?)
-    ''', (
-        buyer.name,
-        buyer.ssn,
-        buyer.email,
-        buyer.phoneNumber
-    ))
-    
-    buyer_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+async def create_buyer(buyer: BuyerCreate):
+    with track_dependency('sqlite', 'insert_buyer'):
+        cursor = await db.execute('''
+            INSERT INTO buyers (name, ssn, email, phoneNumber)
+            VALUES (?, ?, ?, ?)
+        ''', (
+            buyer.name,
+            buyer.ssn,
+            buyer.email,
+            buyer.phoneNumber
+        ))
     
-    return {"id": buyer_id}
+    return {"id": cursor.lastrowid}
 #vistar i gagnagrun
 @app.get("/buyers/{buyer_id}")
-def get_buyer(buyer_id: int):
-    conn = sqlite3.connect('buyers.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT name, ssn, email, phoneNumber FROM buyers WHERE id = ?', (buyer_id,))
-    buyer_row = cursor.fetchone()
-    conn.close()
+async def get_buyer(buyer_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    # Revalidation only needs the row version
+    if if_none_match:
+        with track_dependency('sqlite', 'select_buyer_version'):
+            version_row = await db.fetchone('SELECT version, updated_at, created_at FROM buyers WHERE id = ?', (buyer_id,))
+        if version_row and etag_matches(if_none_match, entity_tag(buyer_id, version_row[0])):
+            return not_modified(cache_headers(buyer_id, *version_row))
+
+    with track_dependency('sqlite', 'select_buyer'):
+        buyer_row = await db.fetchone(
+            'SELECT name, ssn, email, phoneNumber, version, updated_at, created_at FROM buyers WHERE id = ?', (buyer_id,)
+        )
     
     if not buyer_row:
         raise HTTPException(status_code=404, detail="Buyer not found")
     
+    response.headers.update(cache_headers(buyer_id, *buyer_row[4:]))
     return BuyerResponse(
         name=buyer_row[0],
         ssn=buyer_row[1],
@@ -65,7 +87,7 @@ def get_buyer(buyer_id: int):
     )
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+import asyncio
+import hmac
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+# Debug endpoints exist only when a token is set; callers send it as X-Debug-Token
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN', '')
+# Side port for the consumer-only services
+DEBUG_PORT = int(os.getenv('DEBUG_PORT', '9200'))
+# With DEBUG_SIGNALS=1, SIGUSR1 writes a profile and the slow log to DEBUG_DIR
+DEBUG_SIGNALS = os.getenv('DEBUG_SIGNALS', '0') == '1'
+DEBUG_DIR = os.getenv('DEBUG_DIR', '.')
+PROFILE_HZ = 100
+PROFILE_MAX_SECONDS = 60
+PROFILE_SIGNAL_SECONDS = float(os.getenv('PROFILE_SIGNAL_SECONDS', '30'))
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def token_ok(token):
+    return bool(DEBUG_TOKEN) and token is not None and hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode())
+
+
+def frame_name(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """Samples the stack of every thread with sys._current_frames().
+
+    Nothing is hooked into the interpreter, so the cost is one short burst
+    of stack walking per sample while a profile runs and none otherwise.
+    The result is in collapsed-stack form ("thread;outer;...;inner count"),
+    which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def run(self, seconds, hz=PROFILE_HZ):
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            return self._sample(seconds, 1.0 / hz)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds, interval):
+        me = threading.get_ident()
+        stacks = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[';'.join(reversed(stack))] += 1
+            time.sleep(interval)
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+profiler = SamplingProfiler()
+
+
+def add_debug_routes(app, slow_log):
+    """GET /debug/profile?seconds=&hz= and GET /debug/slow, only if DEBUG_TOKEN is set"""
+    if not DEBUG_TOKEN:
+        return
+    from fastapi import Header, HTTPException, Query
+    from fastapi.responses import PlainTextResponse
+
+    def check_token(token):
+        if not token_ok(token):
+            raise HTTPException(status_code=403, detail="Invalid debug token")
+
+    @app.get("/debug/profile", include_in_schema=False)
+    async def profile(
+        seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+        hz: int = Query(PROFILE_HZ, ge=1, le=1000),
+        x_debug_token: Optional[str] = Header(None),
+    ):
+        check_token(x_debug_token)
+        try:
+            collapsed = await asyncio.to_thread(profiler.run, seconds, hz)
+        except ProfilerBusy:
+            raise HTTPException(status_code=409, detail="A profile is already running")
+        return PlainTextResponse(collapsed)
+
+    @app.get("/debug/slow", include_in_schema=False)
+    async def slow_requests(x_debug_token: Optional[str] = Header(None)):
+        check_token(x_debug_token)
+        return {"thresholdSeconds": slow_log.threshold, "entries": slow_log.snapshot()}
+
+
+def _debug_handler(slow_log):
+    class DebugHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if url.path not in ('/debug/profile', '/debug/slow'):
+                return self._send(404, 'application/json', {"detail": "Not Found"})
+            if not token_ok(self.headers.get('X-Debug-Token')):
+                return self._send(403, 'application/json', {"detail": "Invalid debug token"})
+            if url.path == '/debug/slow':
+                return self._send(200, 'application/json', {"thresholdSeconds": slow_log.threshold, "entries": slow_log.snapshot()})
+            try:
+                seconds = float(query.get('seconds', 10))
+                hz = int(query.get('hz', PROFILE_HZ))
+            except ValueError:
+                return self._send(400, 'application/json', {"detail": "seconds and hz must be numbers"})
+            if not (0 < seconds <= PROFILE_MAX_SECONDS and 1 <= hz <= 1000):
+                return self._send(400, 'application/json', {"detail": f"seconds must be in (0, {PROFILE_MAX_SECONDS}], hz in [1, 1000]"})
+            try:
+                collapsed = profiler.run(seconds, hz)
+            except ProfilerBusy:
+                return self._send(409, 'application/json', {"detail": "A profile is already running"})
+            self._send(200, 'text/plain; charset=utf-8', collapsed)
+
+        def _send(self, status, content_type, body):
+            data = (body if isinstance(body, str) else json.dumps(body)).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return DebugHandler
+
+
+def write_debug_snapshot(slow_log, seconds=PROFILE_SIGNAL_SECONDS, directory=DEBUG_DIR):
+    """Profile for `seconds` and write <dir>/profile-<pid>-<time>.folded and slow-<pid>-<time>.json"""
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    slow_path = os.path.join(directory, f"slow-{os.getpid()}-{stamp}.json")
+    with open(slow_path, 'w') as f:
+        json.dump({"thresholdSeconds": slow_log.threshold, "entries": slow_log.snapshot()}, f, indent=2)
+    try:
+        collapsed = profiler.run(seconds)
+    except ProfilerBusy:
+        print("SIGUSR1 ignored: a profile is already running")
+        return
+    profile_path = os.path.join(directory, f"profile-{os.getpid()}-{stamp}.folded")
+    with open(profile_path, 'w') as f:
+        f.write(collapsed)
+    print(f"Wrote {profile_path} and {slow_path}")
+
+
+def start_debug_server(slow_log, port=None):
+    """Debug endpoints on a side port and/or SIGUSR1, for the consumer-only services"""
+    if DEBUG_SIGNALS:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+            target=write_debug_snapshot, args=(slow_log,), name='debug-snapshot', daemon=True
+        ).start())
+        print(f"SIGUSR1 writes a {PROFILE_SIGNAL_SECONDS:g}s profile to {DEBUG_DIR}")
+    if not DEBUG_TOKEN:
+        return None
+    port = int(port or DEBUG_PORT)
+    server = ThreadingHTTPServer(('0.0.0.0', port), _debug_handler(slow_log))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='debug-server', daemon=True).start()
+    print(f"Debug endpoints available on :{port}/debug/profile and /debug/slow")
+    return server
@@ -0,0 +1,74 @@
+import os
+import re
+import time
+from collections import OrderedDict
+
+# Entity responses kept for revalidation with If-None-Match; 0 turns the cache off
+HTTP_CACHE_SIZE = int(os.getenv('HTTP_CACHE_SIZE', '10000'))
+
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class CachedResponse:
+    def __init__(self, response, etag, max_age):
+        self.response = response
+        self.etag = etag
+        self.refresh(max_age)
+
+    def refresh(self, max_age):
+        self.expires = time.monotonic() + max_age
+
+    def fresh(self):
+        return time.monotonic() < self.expires
+
+
+def max_age(response):
+    match = MAX_AGE.search(response.headers.get('Cache-Control', ''))
+    return int(match.group(1)) if match else 0
+
+
+class ResponseCache:
+    """LRU of GET responses that carry an ETag, for httpx or requests alike.
+
+    before() returns a response still within its max-age, or the headers to
+    send with If-None-Match and the entry they validate; after() turns a 304
+    for that entry back into its response and remembers new ones. The entry
+    is passed along because it may be evicted or replaced in between.
+    """
+
+    def __init__(self, size=HTTP_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def before(self, url, headers=None):
+        """(fresh response or None, headers to send, entry being revalidated or None)"""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None, headers, None
+        self._entries.move_to_end(url)
+        if entry.fresh():
+            return entry.response, headers, None
+        return None, dict(headers or {}, **{'If-None-Match': entry.etag}), entry
+
+    def after(self, url, response, entry=None):
+        """The response for the caller. A 304 only comes back here with the entry it validated"""
+        if response.status_code == 304 and entry is not None:
+            entry.refresh(max_age(response))
+            # Put it back unless a newer response was stored meanwhile
+            if self._entries.get(url) in (None, entry):
+                self._store(url, entry)
+            return entry.response
+        etag = response.headers.get('ETag')
+        if response.status_code == 200 and etag:
+            self._store(url, CachedResponse(response, etag, max_age(response)))
+        else:
+            self._entries.pop(url, None)
+        return response
+
+    def _store(self, url, entry):
+        if self.size <= 0:
+            return
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
@@ -1,12 +1,17 @@
-import pika
-import json
-import os
 import requests
 import time
 from dotenv import load_dotenv
+from consumer import Consumer, PermanentError
+from transport import create_transport, TransportConnectionError
+from events import decode_event, event_type_of
+from debug import start_debug_server
+from http_cache import ResponseCache
+from metrics import slow_log, start_metrics_server, track_dependency, track_message
+from tracing import consumer_span, init_tracing, outbound_headers
 
 # Load environment variables
 load_dotenv()
+init_tracing('email-service')
 
 # SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 # SENDGRID_SENDER_EMAIL = os.getenv('SENDGRID_SENDER_EMAIL')
@@ -21,9 +26,19 @@ def send_email(to_email, subject, body):
     print("=" * 50)
     
 
+# Buyers and merchants are revalidated with If-None-Match instead of refetched
+entity_cache = ResponseCache()
+
+def get_entity(url):
+    cached, headers, entry = entity_cache.before(url, outbound_headers())
+    if cached is not None:
+        return cached
+    return entity_cache.after(url, requests.get(url, headers=headers), entry)
+
 def get_buyer_email(buyer_id):
     try:
-        response = requests.get(f"http://buyer-service:8002/buyers/{buyer_id}")
+        with track_dependency('http', 'get_buyer_email'):
+            response = get_entity(f"http://buyer-service:8002/buyers/{buyer_id}")
         if response.status_code == 200:
             return response.json().get('email')
     except:
@@ -32,7 +47,8 @@ def get_buyer_email(buyer_id):
 
 def get_merchant_email(merchant_id):
     try:
-        response = requests.get(f"http://merchant-service:8001/merchants/{merchant_id}")
+        with track_dependency('http', 'get_merchant_email'):
+            response = get_entity(f"http://merchant-service:8001/merchants/{merchant_id}")
         if response.status_code == 200:
             return response.json().get('email')
     except:
@@ -93,55 +109,47 @@ def handle_payment_failure(event_data):
     # Sendir til seljanda
     send_email(merchant_email, subject, body)
 
+EVENT_HANDLERS = {
+    'order_created': handle_order_created,
+    'payment_success': handle_payment_success,
+    'payment_failed': handle_payment_failure,
+}
+
+# EmailService has its own queues so it gets events without card data
+QUEUES = ['email.order_created', 'email.payment_success', 'email.payment_failed']
+
+def handle_event(event_type, event_data):
+    handler = EVENT_HANDLERS.get(event_type)
+    if handler:
+        handler(event_data)
+
 def start_consuming():
     print("Starting EmailService...")
     
     while True:
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=os.getenv('RABBITMQ_URL', 'rabbitmq'),
-                    port=5672
-                )
-            )
-            channel = connection.channel()
-            
-            # declare queues
-            queues = ['order_created', 'payment_success', 'payment_failed']
-            for queue in queues:
-                channel.queue_declare(queue=queue)
+            transport = create_transport()
             
             print("Connected to RabbitMQ. Waiting for events...")
             
-            def callback(ch, method, properties, body):
-                try:
-                    event_data = json.loads(body)
-                    print(f"📨 Received event from queue: {method.routing_key}")
+            # Errors go to the retry/dead-letter queues, see consumer.py
+            def callback(queue, body, properties):
+                with track_message(queue), consumer_span(queue, properties):
+                    try:
+                        event_data = decode_event(body, properties)
+                    except ValueError as e:
+                        raise PermanentError(str(e)) from e
+                    print(f"📨 Received event from queue: {queue}")
                     print(f"Event data: {event_data}")
                     
-                    if method.routing_key == 'order_created':
-                        handle_order_created(event_data)
-                    elif method.routing_key == 'payment_success':
-                        handle_payment_success(event_data)
-                    elif method.routing_key == 'payment_failed':
-                        handle_payment_failure(event_data)
+                    handle_event(event_type_of(queue, properties), event_data)
                     
-                    print(f"Processed event from {method.routing_key}")
-                    
-                except Exception as e:
-                    print(f"Error processing event: {e}")
-            
-            # tekur frá öllum queues
-            for queue in queues:
-                channel.basic_consume(
-                    queue=queue,
-                    on_message_callback=callback,
-                    auto_ack=True
-                )
+                    print(f"Processed event from {queue}")
             
-            channel.start_consuming()
+            # tekur frá öllum queues (declares them with their retry and dead-letter queues)
+            Consumer(transport, callback).consume(QUEUES)
         #error handnling    
-        except pika.exceptions.AMQPConnectionError:
+        except TransportConnectionError:
             print("Cannot connect to RabbitMQ. Retrying in 5 seconds...")
             time.sleep(5)
         except KeyboardInterrupt:
@@ -152,4 +160,6 @@ def start_consuming():
             time.sleep(5)
 
 if __name__ == "__main__":
+    start_metrics_server()
+    start_debug_server(slow_log)
     start_consuming()
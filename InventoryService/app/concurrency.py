@@ -0,0 +1,31 @@
+import asyncio
+import os
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+
+def limit_concurrency(app, limit=None, wait=None):
+    """Cap in-flight requests. Extra requests wait briefly for a slot, then get 503"""
+    limit = int(limit or os.getenv('MAX_CONCURRENT_REQUESTS', '256'))
+    wait = float(wait or os.getenv('CONCURRENCY_WAIT_SECONDS', '5'))
+    state = {}
+
+    @app.middleware("http")
+    async def cap_in_flight_requests(request: Request, call_next):
+        # Created lazily so it binds to the server's event loop
+        semaphore = state.get('semaphore')
+        if semaphore is None:
+            semaphore = state['semaphore'] = asyncio.Semaphore(limit)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=wait)
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Service is at its concurrency limit"},
+                headers={"Retry-After": "1"}
+            )
+        try:
+            return await call_next(request)
+        finally:
+            semaphore.release()
@@ -0,0 +1,65 @@
+import calendar
+import os
+import time
+from email.utils import formatdate
+
+from fastapi import Response
+
+# Cache-Control max-age for entity GETs; 0 means callers revalidate every time
+CACHE_MAX_AGE = int(os.getenv('CACHE_MAX_AGE', '0'))
+
+VERSION_COLUMNS = [('version', 'INTEGER NOT NULL DEFAULT 1'), ('updated_at', 'INTEGER')]
+
+
+def ensure_row_version(conn, table, columns):
+    """Add version/updated_at to a table and bump them whenever one of `columns` changes.
+
+    The trigger covers every writer of the table, including tools that work
+    on the file directly. updated_at stays NULL until the first update.
+    """
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for name, definition in VERSION_COLUMNS:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_row_version AFTER UPDATE OF {', '.join(columns)} ON {table} BEGIN
+            UPDATE {table} SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE id = new.id;
+        END
+    ''')
+
+
+def entity_tag(entity_id, version):
+    return f'"{entity_id}.{version}"'
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match holds this ETag; weak validators compare equal to strong ones"""
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def last_modified(updated_at, created_at):
+    """HTTP date from updated_at (epoch) or else created_at (SQLite CURRENT_TIMESTAMP, UTC)"""
+    if updated_at is None:
+        updated_at = calendar.timegm(time.strptime(created_at, '%Y-%m-%d %H:%M:%S')) if created_at else time.time()
+    return formatdate(updated_at, usegmt=True)
+
+
+def cache_headers(entity_id, version, updated_at, created_at):
+    return {
+        "ETag": entity_tag(entity_id, version),
+        "Last-Modified": last_modified(updated_at, created_at),
+        "Cache-Control": f"max-age={CACHE_MAX_AGE}" if CACHE_MAX_AGE > 0 else "no-cache",
+    }
+
+
+def not_modified(headers):
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,47 @@
+import aiosqlite
+
+
+class Database:
+    """One shared aiosqlite connection per process.
+
+    aiosqlite runs every statement on the connection's own thread, so the
+    event loop never blocks on SQLite and we avoid a new thread per request.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    async def connect(self):
+        if self.conn is None:
+            self.conn = await aiosqlite.connect(self.path)
+            await self.conn.execute('PRAGMA journal_mode=WAL')
+        return self.conn
+
+    async def fetchone(self, sql, params=()):
+        conn = await self.connect()
+        async with conn.execute(sql, params) as cursor:
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql, params=()):
+        conn = await self.connect()
+        async with conn.execute(sql, params) as cursor:
+            return await cursor.fetchall()
+
+    async def execute(self, sql, params=()):
+        """Run one write statement and commit. Returns the cursor (lastrowid, rowcount)"""
+        conn = await self.connect()
+        cursor = await conn.execute(sql, params)
+        await conn.commit()
+        return cursor
+
+    async def executemany(self, sql, rows):
+        conn = await self.connect()
+        cursor = await conn.executemany(sql, rows)
+        await conn.commit()
+        return cursor
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
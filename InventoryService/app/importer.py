@@ -0,0 +1,214 @@
+import codecs
+import csv
+import json
+import os
+from collections import deque
+
+from pydantic import ValidationError
+
+from app.models import ProductCreate
+
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+# Errors listed in the summary; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+# Longest line, or CSV record spanning lines, held in memory; longer ones are
+# reported as errors and parsing picks up again after them
+IMPORT_MAX_RECORD_LENGTH = int(os.getenv('IMPORT_MAX_RECORD_LENGTH', '65536'))
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+CONTENT_TYPES = {
+    'text/csv': CSV,
+    'application/csv': CSV,
+    'application/x-ndjson': NDJSON,
+    'application/ndjson': NDJSON,
+    'application/jsonl': NDJSON,
+    'application/json-lines': NDJSON,
+}
+
+
+def format_for(content_type, override=None):
+    if override:
+        return override
+    return CONTENT_TYPES.get((content_type or '').split(';')[0].strip().lower())
+
+
+def too_long(max_length):
+    return ValueError(f"longer than {max_length} characters")
+
+
+async def iter_lines(chunks, max_length=IMPORT_MAX_RECORD_LENGTH):
+    """Yield (line number, text) from a stream of byte chunks without holding the whole body.
+
+    A line over max_length comes out as (line number, ValueError) and the
+    rest of it is skipped.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    skipping = False
+    number = 0
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if skipping:
+            end = text.find('\n')
+            if end < 0:
+                continue
+            text, skipping = text[end + 1:], False
+        pending += text
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            number += 1
+            yield number, line.rstrip('\r') if len(line) <= max_length else too_long(max_length)
+        if len(pending) > max_length:
+            number += 1
+            yield number, too_long(max_length)
+            pending, skipping = '', True
+    pending += decoder.decode(b'', final=True)
+    if pending and not skipping:
+        yield number + 1, pending.rstrip('\r') if len(pending) <= max_length else too_long(max_length)
+
+
+async def csv_records(lines, max_length=IMPORT_MAX_RECORD_LENGTH):
+    """Yield (line number, dict) using the first line as the header.
+
+    A quoted field may span lines; the record keeps its first line number.
+    A record still open after max_length characters (or at the end) is
+    reported on its first line and the lines after that are parsed again, so
+    one stray quote costs one row.
+    """
+    header = None
+    held = []  # (line number, text) of a record inside a quoted field
+    held_length = quotes = 0
+    replay = deque()
+    source = lines.__aiter__()
+    exhausted = False
+    while True:
+        if replay:
+            number, line = replay.popleft()
+        elif not exhausted:
+            try:
+                number, line = await source.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+                continue
+        elif held:
+            yield held[0][0], ValueError("unterminated quoted field")
+            replay.extend(held[1:])
+            held, held_length, quotes = [], 0, 0
+            continue
+        else:
+            break
+
+        if isinstance(line, Exception):
+            if held:
+                yield held[0][0], ValueError("unterminated quoted field")
+                replay.extendleft(reversed(held[1:] + [(number, line)]))
+                held, held_length, quotes = [], 0, 0
+            else:
+                yield number, line
+            continue
+
+        held.append((number, line))
+        held_length += len(line) + 1
+        quotes += line.count('"')
+        if quotes % 2:
+            if held_length > max_length:
+                yield held[0][0], ValueError(f"unterminated quoted field {too_long(max_length)}")
+                replay.extendleft(reversed(held[1:]))
+                held, held_length, quotes = [], 0, 0
+            continue
+        start, text = held[0][0], '\n'.join(text for _, text in held)
+        held, held_length, quotes = [], 0, 0
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, ValueError(f"expected {len(header)} fields, got {len(values)}")
+            continue
+        yield start, dict(zip(header, values))
+
+
+async def ndjson_records(lines):
+    async for number, line in lines:
+        if isinstance(line, Exception):
+            yield number, line
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield number, ValueError("expected a JSON object")
+            continue
+        yield number, record
+
+
+def validation_message(error: ValidationError):
+    return '; '.join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+class ImportSummary:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.id_ranges = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def add_range(self, shard, first, last, step):
+        self.imported += (last - first) // step + 1
+        for id_range in self.id_ranges:
+            # Chunks that landed back to back in one shard read as one range
+            if id_range["shard"] == shard and id_range["last"] + step == first:
+                id_range["last"] = last
+                return
+        self.id_ranges.append({"shard": shard, "first": first, "last": last, "step": step})
+
+    def to_dict(self):
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "idRanges": self.id_ranges,
+            "errors": self.errors,
+            "errorsTruncated": self.failed > len(self.errors),
+        }
+
+
+async def import_products(chunks, fmt, writer, chunk_size=IMPORT_CHUNK_SIZE):
+    """Parse, validate and insert a streamed CSV/NDJSON body chunk by chunk"""
+    parse = csv_records if fmt == CSV else ndjson_records
+    summary = ImportSummary()
+    rows = []
+    step = writer.router.count
+
+    async def flush():
+        shard, first, last = await writer.insert(rows)
+        summary.add_range(shard, first, last, step)
+        rows.clear()
+
+    async for number, record in parse(iter_lines(chunks)):
+        if isinstance(record, Exception):
+            summary.add_error(number, str(record))
+            continue
+        try:
+            product = ProductCreate(**record)
+        except ValidationError as e:
+            summary.add_error(number, validation_message(e))
+            continue
+        rows.append((product.merchantId, product.productName, product.price, product.quantity))
+        if len(rows) >= chunk_size:
+            await flush()
+    if rows:
+        await flush()
+    return summary
@@ -0,0 +1,95 @@
+import fcntl
+import os
+import threading
+
+from prometheus_client import Gauge
+
+from app.metrics import registry
+
+CONSUMER_LOCK_FILE = os.getenv('CONSUMER_LOCK_FILE', 'inventory-consumer.lock')
+# How often a standby worker tries to take over
+LEADER_RETRY_SECONDS = float(os.getenv('LEADER_RETRY_SECONDS', '5'))
+
+CONSUMER_LEADER = Gauge(
+    'consumer_leader',
+    '1 in the worker process that runs the message consumer',
+    registry=registry,
+)
+
+
+class FileLock:
+    """Exclusive, non-blocking flock. The OS drops it if the process dies"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class LeaderConsumer:
+    """Runs run_consumer(transport) in a background thread in one worker only.
+
+    Every worker starts one from its lifespan; whichever takes the lock
+    consumes and the rest retry every LEADER_RETRY_SECONDS, so another worker
+    takes over if the leader exits.
+    """
+
+    def __init__(self, transport_factory, run_consumer, lock_path=CONSUMER_LOCK_FILE, retry_seconds=LEADER_RETRY_SECONDS):
+        self.transport_factory = transport_factory
+        self.run_consumer = run_consumer
+        self.lock = FileLock(lock_path)
+        self.retry_seconds = retry_seconds
+        self.transport = None
+        self.is_leader = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='event-consumer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self.lock.acquire():
+                self._lead()
+            self._stopping.wait(self.retry_seconds)
+
+    def _lead(self):
+        self.is_leader = True
+        CONSUMER_LEADER.set(1)
+        print(f"Worker {os.getpid()} is the consumer leader")
+        try:
+            self.transport = self.transport_factory()
+            if not self._stopping.is_set():
+                self.run_consumer(self.transport)
+        except Exception as e:
+            print(f"Consumer stopped: {e}")
+        finally:
+            self.transport = None
+            self.is_leader = False
+            CONSUMER_LEADER.set(0)
+            self.lock.release()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self.transport is not None:
+            self.transport.stop()
+        if self._thread is not None:
+            self._thread.join(timeout)
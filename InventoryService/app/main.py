@@ -1,134 +1,197 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+import asyncio
 import sqlite3
-import json
-import threading
+import time
+from typing import Optional
 from app.models import ProductCreate, ProductResponse
-from app.rabbitmq_client import RabbitMQClient
+from app.concurrency import limit_concurrency
+from app.conditional import cache_headers, etag_matches, entity_tag, not_modified
+from app.consumer import Consumer, PermanentError
+from app.importer import CSV, NDJSON, format_for, import_products
+from app.leader import LeaderConsumer
+from app.search import InvalidSearch, search_products
+from app.shards import ShardRouter
+from app.transport import create_transport
+from app.events import decode_event
+from app.debug import add_debug_routes
+from app.metrics import instrument_app, track_dependency, track_message, slow_log
+from app.tracing import consumer_span, init_tracing, trace_requests
 
-app = FastAPI(title="Inventory Service")
+# Products are split over INVENTORY_SHARDS files by id, see app.shards
+shards = ShardRouter()
+
+@asynccontextmanager
+async def lifespan(app):
+    # Nothing blocking runs at import, so several workers can share the port
+    await asyncio.to_thread(init_db)
+    consumer = LeaderConsumer(create_transport, run_consumer)
+    consumer.start()
+    yield
+    await asyncio.to_thread(consumer.stop)
+    await shards.close()
+
+app = FastAPI(title="Inventory Service", lifespan=lifespan)
+limit_concurrency(app)
+instrument_app(app)
+add_debug_routes(app, slow_log)
+trace_requests(app)
+init_tracing('inventory-service')
 
 # db setup
 def init_db():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            merchantId INTEGER NOT NULL,
-            productName TEXT NOT NULL,
-            price REAL NOT NULL,
-            quantity INTEGER NOT NULL,
-            reserved INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-init_db()
+    shards.init_db()
 
 #Honldar payment Success og failure events
+# How long handled payment events are remembered for dropping redeliveries
+PROCESSED_RETENTION_SECONDS = 7 * 86400
+
+def prune_processed_events(now=None):
+    cutoff = int((now or time.time()) - PROCESSED_RETENTION_SECONDS)
+    for path in shards.paths:
+        conn = sqlite3.connect(path, timeout=30)
+        with conn:
+            conn.execute('DELETE FROM processed_payment_events WHERE processedAt < ?', (cutoff,))
+        conn.close()
+
 def handle_payment_event(event_data, payment_success: bool):
+    """Apply a payment result to stock once; returns False for an event already applied"""
     product_id = event_data.get('productId')
-    
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    if payment_success:
-        cursor.execute('''
-            UPDATE products 
-            SET quantity = quantity - 1, reserved = reserved - 1
-            WHERE id = ? AND reserved > 0
-        ''', (product_id,))
-    else:
-        cursor.execute('''
-            UPDATE products 
-            SET reserved = reserved - 1
-            WHERE id = ? AND reserved > 0
-        ''', (product_id,))
-    
-    conn.commit()
-    conn.close()
+    event_type = 'payment_success' if payment_success else 'payment_failed'
+    
+    with track_dependency('sqlite', 'update_product_after_payment'):
+        conn = sqlite3.connect(shards.path_for(product_id), timeout=30)
+        cursor = conn.cursor()
+        
+        # Recorded in the same transaction as the stock change
+        cursor.execute(
+            'INSERT OR IGNORE INTO processed_payment_events (eventType, orderId, processedAt) VALUES (?, ?, ?)',
+            (event_type, event_data['id'], int(time.time()))
+        )
+        if cursor.rowcount == 0:
+            conn.close()
+            print(f"Skipping {event_type} for order {event_data['id']}: already applied")
+            return False
+        
+        if payment_success:
+            cursor.execute('''
+                UPDATE products 
+                SET quantity = quantity - 1, reserved = reserved - 1
+                WHERE id = ? AND reserved > 0
+            ''', (product_id,))
+        else:
+            cursor.execute('''
+                UPDATE products 
+                SET reserved = reserved - 1
+                WHERE id = ? AND reserved > 0
+            ''', (product_id,))
+        
+        conn.commit()
+        conn.close()
     print(f"Updated inventory for product {product_id} - payment {'success' if payment_success else 'failed'}")
+    return True
 
-def start_rabbitmq_consumer():
-    rabbitmq = RabbitMQClient()
-    
-    def callback(ch, method, properties, body):
-        try:
-            event_data = json.loads(body)
-            print(f"InventoryService received {method.routing_key} event")
+def run_consumer(transport):
+    prune_processed_events()
+
+    # Errors go to the retry/dead-letter queues, see consumer.py
+    def callback(queue, body, properties):
+        with track_message(queue), consumer_span(queue, properties):
+            try:
+                event_data = decode_event(body, properties)
+            except ValueError as e:
+                raise PermanentError(str(e)) from e
+            print(f"InventoryService received {queue} event")
             
-            if method.routing_key == 'payment_success':
+            if queue == 'payment_success':
                 handle_payment_event(event_data, payment_success=True)
-            elif method.routing_key == 'payment_failed':
+            elif queue == 'payment_failed':
                 handle_payment_event(event_data, payment_success=False)
-                
-        except Exception as e:
-            print(f"Error processing payment event: {e}")
     
-    rabbitmq.start_consuming(callback)
-
-rabbitmq_thread = threading.Thread(target=start_rabbitmq_consumer, daemon=True)
-rabbitmq_thread.start()
+    Consumer(transport, callback).consume(['payment_success', 'payment_failed'])
 
 @app.post("/products", status_code=201)
-def create_product(product: ProductCreate):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO products (merchantId, productName, price, quantity, reserved)
-        VALUES (?, ?, ?, ?, 0)
-    ''', (
-        product.merchantId,
-        product.productName,
-        product.price,
-        product.quantity
-    ))
-    
-    product_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+async def create_product(product: ProductCreate):
+    with track_dependency('sqlite', 'insert_product'):
+        product_id = await shards.insert_product(
+            product.merchantId,
+            product.productName,
+            product.price,
+            product.quantity
+        )
     
     return {"id": product_id}
 
 #temp endpoint
 @app.post("/create-test-products")
-def create_test_products():
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-
+async def create_test_products():
     test_products = [
         (1, "Test Product 123", 49.99, 100),
         (1, "Test Product 456", 29.99, 50),
         (1, "Test Product 789", 9.99, 200)
     ]
     
-    for merchant_id, name, price, quantity in test_products:
-        cursor.execute('''
-            INSERT INTO products (merchantId, productName, price, quantity, reserved)
-            VALUES (?, ?, ?, ?, 0)
-        ''', (merchant_id, name, price, quantity))
-    
-    conn.commit()
-    conn.close()
-    return {"message": "Test products created with IDs 1, 2, 3"}
+    writer = shards.bulk_writer()
+    try:
+        _, first, last = await writer.insert(test_products)
+    finally:
+        await writer.close()
+    ids = range(first, last + 1, shards.count)
+    return {"message": f"Test products created with IDs {', '.join(str(i) for i in ids)}"}
+
+@app.post("/products/import")
+async def import_product_file(request: Request, fmt: Optional[str] = Query(None, alias='format')):
+    # The body is parsed as it arrives, so catalogue size doesn't change memory use
+    fmt = format_for(request.headers.get('content-type'), fmt)
+    if fmt not in (CSV, NDJSON):
+        raise HTTPException(
+            status_code=415,
+            detail="Send text/csv or application/x-ndjson, or pass ?format=csv or ?format=ndjson"
+        )
+    writer = shards.bulk_writer()
+    try:
+        with track_dependency('sqlite', 'import_products'):
+            summary = await import_products(request.stream(), fmt, writer)
+    finally:
+        await writer.close()
+    return summary.to_dict()
+
+# Declared before /products/{product_id} so "search" isn't read as an id
+@app.get("/products/search")
+async def search(
+    q: str,
+    merchantId: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    try:
+        with track_dependency('sqlite', 'search_products'):
+            return await search_products(shards, q, merchantId, limit, cursor)
+    except InvalidSearch as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/products/{product_id}")
-def get_product(product_id: int):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT merchantId, productName, price, quantity, reserved FROM products WHERE id = ?', 
-        (product_id,)
-    )
-    product_row = cursor.fetchone()
-    conn.close()
+async def get_product(product_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    shard = shards.for_product(product_id)
+    # Revalidation only needs the row version
+    if if_none_match:
+        with track_dependency('sqlite', 'select_product_version'):
+            version_row = await shard.fetchone(
+                'SELECT version, updated_at, created_at FROM products WHERE id = ?', (product_id,)
+            )
+        if version_row and etag_matches(if_none_match, entity_tag(product_id, version_row[0])):
+            return not_modified(cache_headers(product_id, *version_row))
+
+    with track_dependency('sqlite', 'select_product'):
+        product_row = await shard.fetchone(
+            'SELECT merchantId, productName, price, quantity, reserved, version, updated_at, created_at FROM products WHERE id = ?', 
+            (product_id,)
+        )
     
     if not product_row:
         raise HTTPException(status_code=404, detail="Product does not exist")
     
+    response.headers.update(cache_headers(product_id, *product_row[5:]))
     return ProductResponse(
         merchantId=product_row[0],
         productName=product_row[1],
@@ -138,36 +201,29 @@ def get_product(product_id: int):
     )
 
 @app.post("/products/{product_id}/reserve")
-def reserve_product(product_id: int):
-    conn = sqlite3.connect('inventory.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT quantity, reserved FROM products WHERE id = ?', (product_id,))
-    product = cursor.fetchone()
+async def reserve_product(product_id: int):
+    with track_dependency('sqlite', 'select_product_stock'):
+        product = await shards.for_product(product_id).fetchone('SELECT quantity, reserved FROM products WHERE id = ?', (product_id,))
     
     if not product:
-        conn.close()
         return {"success": False, "message": "Product does not exist"}
     
     available = product[0] - product[1]  
     if available <= 0:
-        conn.close()
         return {"success": False, "message": "Product is sold out"}
     
     # geymir eitt item
-    cursor.execute(
-        'UPDATE products SET reserved = reserved + 1 WHERE id = ? AND quantity > reserved',
-        (product_id,)
-    )
-    
+    with track_dependency('sqlite', 'reserve_product'):
+        cursor = await shards.for_product(product_id).execute(
+            'UPDATE products SET reserved = reserved + 1 WHERE id = ? AND quantity > reserved',
+            (product_id,)
+        )
     success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
     
     return {"success": success, "message": "Product reserved" if success else "Reservation failed"}
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
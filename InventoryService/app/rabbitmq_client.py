@@ -1,10 +1,9 @@
 import pika
-import json
-import os
 import time
 import logging
+from app.transport import PREFETCH_COUNT, Transport, broker_host
 
-class RabbitMQClient:
+class RabbitMQClient(Transport):
     def __init__(self):
         self.connection = None
         self.channel = None
@@ -17,7 +16,7 @@ class RabbitMQClient:
             try:
                 self.connection = pika.BlockingConnection(
                     pika.ConnectionParameters(
-                        host=os.getenv('RABBITMQ_URL', 'rabbitmq'),
+                        host=broker_host(),
                         port=5672,
                         connection_attempts=3,
                         retry_delay=3,
@@ -55,27 +54,52 @@ class RabbitMQClient:
             return self.connect()
         return True
 
-    def start_consuming(self, callback):
+    def declare_queue(self, queue, arguments=None):
+        if self.ensure_connection():
+            self.channel.queue_declare(queue=queue, durable=True, arguments=arguments)
+
+    def publish(self, queue, body, properties=None):
+        if not self.ensure_connection():
+            raise ConnectionError("No RabbitMQ connection")
+        properties = properties or {}
+        self.channel.basic_publish(
+            exchange='',
+            routing_key=queue,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=properties.get('content_type'),
+                headers=properties.get('headers'),
+                delivery_mode=2,
+            )
+        )
+
+    def consume(self, queues, callback):
         """Start consuming messages with connection validation"""
         if not self.ensure_connection():
             logging.error("❌ Cannot start consuming: No RabbitMQ connection")
             return False
+
+        def on_message(ch, method, props, body):
+            try:
+                callback(method.routing_key, body, {
+                    'content_type': props.content_type,
+                    'headers': props.headers or {},
+                })
+            except Exception as e:
+                logging.error(f"❌ Requeued message from {method.routing_key}: {e}")
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                return
+            ch.basic_ack(delivery_tag=method.delivery_tag)
             
         try:
             # Set up quality of service
-            self.channel.basic_qos(prefetch_count=1)
+            self.channel.basic_qos(prefetch_count=PREFETCH_COUNT)
             
-            # Consume from payment queues
-            self.channel.basic_consume(
-                queue='payment_success', 
-                on_message_callback=callback, 
-                auto_ack=True
-            )
-            self.channel.basic_consume(
-                queue='payment_failed', 
-                on_message_callback=callback, 
-                auto_ack=True
-            )
+            for queue in queues:
+                self.channel.basic_consume(
+                    queue=queue, 
+                    on_message_callback=on_message
+                )
             
             logging.info("🔄 InventoryService listening for payment events...")
             self.channel.start_consuming()
@@ -86,7 +110,11 @@ class RabbitMQClient:
             # Try to reconnect and restart consuming
             self.close()
             time.sleep(2)
-            return self.start_consuming(callback)  # Recursive retry
+            return self.consume(queues, callback)  # Recursive retry
+
+    def start_consuming(self, callback):
+        """Consume from the payment queues"""
+        return self.consume(['payment_success', 'payment_failed'], callback)
 
     def safe_consume(self, callback):
         """Wrapper for consuming with automatic reconnection"""
@@ -105,6 +133,11 @@ class RabbitMQClient:
                 logging.warning("🔄 Reconnecting in 10 seconds...")
                 time.sleep(10)
 
+    def stop(self):
+        """Stop start_consuming from another thread"""
+        if self.is_connected():
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
     def close(self):
         """Close the connection gracefully"""
         try:
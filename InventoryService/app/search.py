@@ -0,0 +1,95 @@
+import asyncio
+import base64
+import json
+import re
+
+SEARCH_SQL = '''
+    SELECT id, merchantId, productName, price, quantity, reserved, score FROM (
+        SELECT p.id, p.merchantId, p.productName, p.price, p.quantity, p.reserved,
+               bm25(products_fts) AS score
+        FROM products_fts
+        JOIN products p ON p.id = products_fts.rowid
+        WHERE products_fts MATCH ? {merchant_filter}
+    )
+    {after}
+    ORDER BY score, id
+    LIMIT ?
+'''
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+class InvalidSearch(ValueError):
+    pass
+
+
+def fts_query(q):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix.
+
+    Words are quoted so FTS5 operators in user input are taken literally.
+    """
+    words = TOKEN.findall(q)
+    if not words:
+        raise InvalidSearch("Search text has no words")
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def encode_cursor(score, product_id):
+    return base64.urlsafe_b64encode(json.dumps([score, product_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        score, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(product_id)
+    except (ValueError, TypeError):
+        raise InvalidSearch("Invalid cursor")
+
+
+async def search_shard(db, match, merchant_id, after, limit):
+    params = [match]
+    merchant_filter = ''
+    if merchant_id is not None:
+        merchant_filter = 'AND p.merchantId = ?'
+        params.append(merchant_id)
+    after_clause = ''
+    if after is not None:
+        # Keyset: strictly after the last result of the previous page
+        after_clause = 'WHERE score > ? OR (score = ? AND id > ?)'
+        params.extend([after[0], after[0], after[1]])
+    params.append(limit)
+    sql = SEARCH_SQL.format(merchant_filter=merchant_filter, after=after_clause)
+    return await db.fetchall(sql, params)
+
+
+async def search_products(router, q, merchant_id=None, limit=20, cursor=None):
+    """Ranked matches over every shard, best first, with a cursor for the next page.
+
+    bm25 is lower-is-better. Each shard ranks against its own statistics,
+    which is close enough for products spread round-robin.
+    """
+    match = fts_query(q)
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells us whether there is another page
+    per_shard = await asyncio.gather(*(
+        search_shard(db, match, merchant_id, after, limit + 1) for db in router.shards
+    ))
+    rows = sorted((row for rows in per_shard for row in rows), key=lambda row: (row[6], row[0]))
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1][6], page[-1][0]) if len(rows) > limit else None
+    return {
+        "results": [
+            {
+                "id": row[0],
+                "merchantId": row[1],
+                "productName": row[2],
+                "price": row[3],
+                "quantity": row[4],
+                "reserved": row[5],
+                "score": row[6],
+            }
+            for row in page
+        ],
+        "nextCursor": next_cursor,
+    }
@@ -0,0 +1,254 @@
+import glob
+import itertools
+import os
+import re
+import sqlite3
+
+import aiosqlite
+
+from app.conditional import ensure_row_version
+from app.db import Database
+
+INVENTORY_SHARDS = int(os.getenv('INVENTORY_SHARDS', '1'))
+INVENTORY_DATA_DIR = os.getenv('INVENTORY_DATA_DIR', '.')
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        merchantId INTEGER NOT NULL,
+        productName TEXT NOT NULL,
+        price REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        reserved INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Full-text index over productName, kept in sync by the triggers below
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        productName,
+        content='products',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, productName) VALUES (new.id, new.productName);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, productName) VALUES ('delete', old.id, old.productName);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF productName ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, productName) VALUES ('delete', old.id, old.productName);
+        INSERT INTO products_fts (rowid, productName) VALUES (new.id, new.productName);
+    END
+    ''',
+    # Payment events already applied to this shard's stock, so redeliveries are skipped
+    '''
+    CREATE TABLE IF NOT EXISTS processed_payment_events (
+        eventType TEXT NOT NULL,
+        orderId INTEGER NOT NULL,
+        processedAt INTEGER NOT NULL,
+        PRIMARY KEY (eventType, orderId)
+    ) WITHOUT ROWID
+    ''',
+    # Which layout a file belongs to, so a wrong INVENTORY_SHARDS fails loudly
+    '''
+    CREATE TABLE IF NOT EXISTS shard_info (
+        shard_index INTEGER NOT NULL,
+        shard_count INTEGER NOT NULL
+    )
+    ''',
+]
+
+
+PRODUCT_COLUMNS = '(id, merchantId, productName, price, quantity, reserved)'
+
+
+class ShardLayoutError(RuntimeError):
+    pass
+
+
+def shard_path(index, count, data_dir=INVENTORY_DATA_DIR):
+    # A single shard keeps the original file name
+    if count == 1:
+        return os.path.join(data_dir, 'inventory.db')
+    return os.path.join(data_dir, f'inventory-{index}.db')
+
+
+def shard_index(product_id, count):
+    return product_id % count
+
+
+def check_layout(data_dir, count):
+    """Refuse to start next to shard files from a different shard count"""
+    single = shard_path(0, 1, data_dir)
+    numbered = sorted(
+        int(m.group(1)) for m in
+        (re.search(r'inventory-(\d+)\.db$', path) for path in glob.glob(os.path.join(data_dir, 'inventory-*.db')))
+        if m
+    )
+    # The Dockerfile touches an empty inventory.db, which is not a layout
+    single_in_use = os.path.exists(single) and os.path.getsize(single) > 0
+    stray = (count == 1 and numbered) or (count > 1 and (single_in_use or (numbered and numbered[-1] >= count)))
+    if stray:
+        raise ShardLayoutError(
+            f"{data_dir} holds inventory files from another shard count than INVENTORY_SHARDS={count}; "
+            "run tools/reshard_inventory.py to change the shard count"
+        )
+
+
+def detect_shard_count(data_dir):
+    """Shard count of the files in data_dir, from shard_info or else the file names"""
+    single = shard_path(0, 1, data_dir)
+    numbered = glob.glob(os.path.join(data_dir, 'inventory-[0-9]*.db'))
+    # An empty inventory.db (the Dockerfile touches one) does not count
+    single_in_use = os.path.exists(single) and os.path.getsize(single) > 0
+    if single_in_use and numbered:
+        raise ShardLayoutError(f"Both inventory.db and inventory-N.db files in {data_dir}")
+    path = single if single_in_use else shard_path(0, 2, data_dir)
+    if not os.path.exists(path):
+        raise ShardLayoutError(f"No inventory database in {data_dir}")
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute('SELECT shard_count FROM shard_info').fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else max(1, len(numbered))
+
+
+def rebuild_search_index(conn):
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def create_schema(conn, index, count):
+    """Create the tables in one shard file and check it belongs to this layout"""
+    had_index = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'products_fts'"
+    ).fetchone() is not None
+    for statement in SCHEMA:
+        conn.execute(statement)
+    # ETags for GET /products/{id}; reservations and stock changes bump the version
+    ensure_row_version(conn, 'products', ['merchantId', 'productName', 'price', 'quantity', 'reserved'])
+    if not had_index:
+        # Products from before the index existed
+        rebuild_search_index(conn)
+    row = conn.execute('SELECT shard_index, shard_count FROM shard_info').fetchone()
+    if row is None:
+        conn.execute('INSERT INTO shard_info (shard_index, shard_count) VALUES (?, ?)', (index, count))
+    elif row != (index, count):
+        raise ShardLayoutError(
+            f"Shard file is shard {row[0]} of {row[1]} but INVENTORY_SHARDS={count} expects shard {index} of {count}; "
+            "run tools/reshard_inventory.py to change the shard count"
+        )
+    conn.commit()
+
+
+class ShardRouter:
+    """Products split over INVENTORY_SHARDS SQLite files by id.
+
+    Product ids keep their shard: shard k only hands out ids with
+    id % count == k, so a lookup by id needs no directory. Each shard has its
+    own connection and its own write lock.
+    """
+
+    def __init__(self, count=INVENTORY_SHARDS, data_dir=INVENTORY_DATA_DIR):
+        self.count = count
+        self.data_dir = data_dir
+        self.paths = [shard_path(i, count, data_dir) for i in range(count)]
+        self.shards = [Database(path) for path in self.paths]
+        # New products go round-robin, starting at shard 1 so a fresh layout hands out 1, 2, 3, ...
+        self._next_shard = itertools.count(1)
+
+    def init_db(self):
+        check_layout(self.data_dir, self.count)
+        for index, path in enumerate(self.paths):
+            conn = sqlite3.connect(path)
+            try:
+                create_schema(conn, index, self.count)
+            finally:
+                conn.close()
+
+    def index_for(self, product_id):
+        return shard_index(product_id, self.count)
+
+    def for_product(self, product_id):
+        return self.shards[self.index_for(product_id)]
+
+    def path_for(self, product_id):
+        return self.paths[self.index_for(product_id)]
+
+    async def insert_product(self, merchant_id, product_name, price, quantity):
+        """Insert into the next shard and return the new product id"""
+        index = next(self._next_shard) % self.count
+        first_id = index or self.count
+        # One statement, so the id is picked under the shard's write lock
+        cursor = await self.shards[index].execute(f'''
+            INSERT INTO products {PRODUCT_COLUMNS}
+            VALUES ((SELECT COALESCE(MAX(id) + ?, ?) FROM products), ?, ?, ?, ?, 0)
+        ''', (self.count, first_id, merchant_id, product_name, price, quantity))
+        return cursor.lastrowid
+
+    def next_shard(self):
+        return next(self._next_shard) % self.count
+
+    def bulk_writer(self):
+        return BulkWriter(self)
+
+    async def close(self):
+        for shard in self.shards:
+            await shard.close()
+
+
+class BulkWriter:
+    """Chunked inserts for one import, on connections of its own.
+
+    Each chunk goes to one shard in a single BEGIN IMMEDIATE transaction, so
+    its ids are known up front: first, first + count, ... Nothing else can
+    write to that shard in between, not even another worker process.
+    """
+
+    def __init__(self, router):
+        self.router = router
+        self._conns = {}
+
+    async def _conn(self, index):
+        conn = self._conns.get(index)
+        if conn is None:
+            conn = await aiosqlite.connect(self.router.paths[index], isolation_level=None)
+            self._conns[index] = conn
+        return conn
+
+    async def insert(self, rows):
+        """Insert (merchantId, productName, price, quantity) rows; returns (shard, first id, last id)"""
+        count = self.router.count
+        index = self.router.next_shard()
+        conn = await self._conn(index)
+        await conn.execute('BEGIN IMMEDIATE')
+        try:
+            async with conn.execute('SELECT MAX(id) FROM products') as cursor:
+                (max_id,) = await cursor.fetchone()
+            first = max_id + count if max_id is not None else (index or count)
+            await conn.executemany(
+                f'INSERT INTO products {PRODUCT_COLUMNS} VALUES (?, ?, ?, ?, ?, 0)',
+                [(first + i * count,) + tuple(row) for i, row in enumerate(rows)]
+            )
+            await conn.execute('COMMIT')
+        except BaseException:
+            await conn.execute('ROLLBACK')
+            raise
+        return index, first, first + (len(rows) - 1) * count
+
+    async def close(self):
+        for conn in self._conns.values():
+            await conn.close()
+        self._conns = {}
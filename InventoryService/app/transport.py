@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+# Unacked messages a consumer may hold at once
+PREFETCH_COUNT = int(os.getenv('CONSUMER_PREFETCH', '10'))
+
+
+class Transport:
+    """Minimal broker interface used by the consumers.
+
+    Consumer callbacks are called as callback(queue, body, properties) where
+    properties is a plain dict (content_type, headers, ...). A message is
+    acked when the callback returns and requeued if it raises.
+    """
+
+    def declare_queue(self, queue, arguments=None):
+        raise NotImplementedError
+
+    def publish(self, queue, body, properties=None):
+        raise NotImplementedError
+
+    def consume(self, queues, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        """Make a blocking consume() return. Safe to call from another thread"""
+        self.close()
+
+    def close(self):
+        pass
+
+
+def broker_host():
+    """RABBITMQ_URL may be a bare host name or an amqp:// URL"""
+    url = os.getenv('RABBITMQ_URL', 'rabbitmq')
+    if '://' in url:
+        return urlparse(url).hostname
+    return url
+
+
+class InMemoryBroker:
+    """In-process stand-in for RabbitMQ's default exchange.
+
+    Queues are FIFO and consumers on the same queue compete round-robin,
+    like they do on the real broker. Nothing is delivered until drain() is
+    called, so the caller decides which thread does the work. Queues declared
+    with x-message-ttl and x-dead-letter-routing-key move expired messages on,
+    which is how the delayed retry queues work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._arguments = {}
+        self._consumers = {}
+        self._next_consumer = {}
+
+    def declare_queue(self, queue, arguments=None):
+        with self._lock:
+            self._queues.setdefault(queue, deque())
+            if arguments:
+                self._arguments[queue] = dict(arguments)
+
+    def publish(self, queue, body, properties=None):
+        with self._lock:
+            ttl = self._arguments.get(queue, {}).get('x-message-ttl')
+            expires = time.monotonic() + ttl / 1000 if ttl is not None else None
+            self._queues.setdefault(queue, deque()).append((body, dict(properties or {}), expires))
+
+    def subscribe(self, queue, callback):
+        with self._lock:
+            self._queues.setdefault(queue, deque())
+            self._consumers.setdefault(queue, []).append(callback)
+
+    def depth(self, queue):
+        with self._lock:
+            return len(self._queues.get(queue, ()))
+
+    def _expire(self):
+        now = time.monotonic()
+        for queue, arguments in self._arguments.items():
+            target = arguments.get('x-dead-letter-routing-key')
+            messages = self._queues[queue]
+            while target and messages and messages[0][2] is not None and messages[0][2] <= now:
+                body, properties, _ = messages.popleft()
+                self._queues.setdefault(target, deque()).append((body, properties, None))
+
+    def _next(self):
+        with self._lock:
+            self._expire()
+            for queue, messages in self._queues.items():
+                consumers = self._consumers.get(queue)
+                if messages and consumers:
+                    index = self._next_consumer.get(queue, 0) % len(consumers)
+                    self._next_consumer[queue] = index + 1
+                    return queue, consumers[index], messages.popleft()
+        return None
+
+    def drain(self, max_messages=None):
+        """Deliver queued messages until every consumed queue is empty.
+
+        Messages still waiting in a delay queue are left for a later drain().
+        """
+        delivered = 0
+        while max_messages is None or delivered < max_messages:
+            item = self._next()
+            if item is None:
+                break
+            queue, callback, message = item
+            body, properties, _ = message
+            try:
+                callback(queue, body, properties)
+            except Exception:
+                # Same as a nack with requeue
+                with self._lock:
+                    self._queues[queue].appendleft(message)
+                raise
+            delivered += 1
+        return delivered
+
+
+default_broker = InMemoryBroker()
+
+
+class InMemoryTransport(Transport):
+    def __init__(self, broker=None):
+        self.broker = broker or default_broker
+        self._closed = threading.Event()
+
+    def declare_queue(self, queue, arguments=None):
+        self.broker.declare_queue(queue, arguments)
+
+    def publish(self, queue, body, properties=None):
+        self.broker.publish(queue, body, properties)
+
+    def consume(self, queues, callback):
+        for queue in queues:
+            self.broker.subscribe(queue, callback)
+        # Delivery happens in whichever thread calls broker.drain()
+        self._closed.wait()
+
+    def close(self):
+        self._closed.set()
+
+
+def create_transport():
+    if os.getenv('MESSAGE_TRANSPORT', 'rabbitmq') == 'memory':
+        return InMemoryTransport()
+    from app.rabbitmq_client import RabbitMQClient
+    return RabbitMQClient()
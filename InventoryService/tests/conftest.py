@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modules import each other as app.<module>, as under uvicorn
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(SERVICE_DIR), 'tools'))
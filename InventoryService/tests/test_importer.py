@@ -0,0 +1,75 @@
+import asyncio
+
+from app.importer import csv_records, iter_lines, ndjson_records
+
+
+async def chunks_of(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def collect(records):
+    async def run():
+        return [item async for item in records]
+    return asyncio.run(run())
+
+
+def parse_csv(data, size=7, max_length=100):
+    return [
+        (number, str(record) if isinstance(record, Exception) else record)
+        for number, record in collect(csv_records(iter_lines(chunks_of(data, size), max_length), max_length))
+    ]
+
+
+def test_lines_split_across_chunks():
+    data = 'a,b\r\n﻿c,d\nlast'.encode('utf-8')
+    assert collect(iter_lines(chunks_of(data, 3))) == [(1, 'a,b'), (2, '﻿c,d'), (3, 'last')]
+
+
+def test_multibyte_characters_split_across_chunks():
+    assert collect(iter_lines(chunks_of('þú\nævi'.encode('utf-8'), 1))) == [(1, 'þú'), (2, 'ævi')]
+
+
+def test_overlong_line_is_reported_and_skipped():
+    data = b'x' * 500 + b'\nshort\n' + b'y' * 500
+    lines = collect(iter_lines(chunks_of(data, 16), max_length=100))
+    assert [(number, str(line)) for number, line in lines] == [
+        (1, 'longer than 100 characters'), (2, 'short'), (3, 'longer than 100 characters'),
+    ]
+
+
+def test_csv_quoted_field_spanning_lines():
+    data = b'merchantId,productName,price,quantity\n1,"Blue\nwidget",2.5,3\n1,Red,1,1\n'
+    assert parse_csv(data) == [
+        (2, {'merchantId': '1', 'productName': 'Blue\nwidget', 'price': '2.5', 'quantity': '3'}),
+        (4, {'merchantId': '1', 'productName': 'Red', 'price': '1', 'quantity': '1'}),
+    ]
+
+
+def test_csv_wrong_field_count():
+    assert parse_csv(b'a,b\n1,2,3\n') == [(2, 'expected 2 fields, got 3')]
+
+
+def test_csv_stray_quote_costs_one_row():
+    rows = ''.join(f'{i},item{i}\n' for i in range(2, 40))
+    data = ('a,b\n1,"broken\n' + rows).encode('utf-8')
+    records = parse_csv(data, max_length=100)
+    assert records[0] == (2, 'unterminated quoted field longer than 100 characters')
+    assert records[1:] == [(i + 1, {'a': str(i), 'b': f'item{i}'}) for i in range(2, 40)]
+
+
+def test_csv_stray_quote_at_end():
+    assert parse_csv(b'a,b\n1,2\n3,"4\n5,6\n') == [
+        (2, {'a': '1', 'b': '2'}),
+        (3, 'unterminated quoted field'),
+        (4, {'a': '5', 'b': '6'}),
+    ]
+
+
+def test_ndjson_records():
+    data = b'{"a": 1}\n\n[1]\nnot json\n' + b'{"b": "' + b'x' * 200 + b'"}\n'
+    records = collect(ndjson_records(iter_lines(chunks_of(data, 5), max_length=100)))
+    assert records[0] == (1, {'a': 1})
+    assert [(number, str(error).split(':')[0]) for number, error in records[1:]] == [
+        (3, 'expected a JSON object'), (4, 'invalid JSON'), (5, 'longer than 100 characters'),
+    ]
@@ -0,0 +1,49 @@
+import sqlite3
+
+import reshard_inventory
+from app.shards import create_schema, shard_path
+
+
+def make_layout(data_dir, count, products, events):
+    for index in range(count):
+        conn = sqlite3.connect(shard_path(index, count, str(data_dir)))
+        create_schema(conn, index, count)
+        conn.executemany(
+            "INSERT INTO products (id, merchantId, productName, price, quantity) VALUES (?, 1, 'Widget', 1.0, 5)",
+            [(product_id,) for product_id in products if product_id % count == index]
+        )
+        if index == 0:
+            conn.executemany(
+                'INSERT INTO processed_payment_events (eventType, orderId, processedAt) VALUES (?, ?, 0)', events
+            )
+        conn.commit()
+        conn.close()
+
+
+def read(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_reshard_moves_products_to_their_new_shard(tmp_path):
+    make_layout(tmp_path, 1, [1, 2, 3, 4, 5], [])
+
+    reshard_inventory.main(['--data-dir', str(tmp_path), '--to', '2'])
+
+    assert read(shard_path(0, 2, str(tmp_path)), 'SELECT id FROM products ORDER BY id') == [(2,), (4,)]
+    assert read(shard_path(1, 2, str(tmp_path)), 'SELECT id FROM products ORDER BY id') == [(1,), (3,), (5,)]
+    assert read(shard_path(1, 2, str(tmp_path)), 'SELECT shard_index, shard_count FROM shard_info') == [(1, 2)]
+
+
+def test_reshard_keeps_applied_payment_events_in_every_shard(tmp_path):
+    events = [('payment_success', 7), ('payment_failed', 8)]
+    make_layout(tmp_path, 1, [1, 2], events)
+
+    reshard_inventory.main(['--data-dir', str(tmp_path), '--to', '3'])
+
+    for index in range(3):
+        rows = read(shard_path(index, 3, str(tmp_path)), 'SELECT eventType, orderId FROM processed_payment_events')
+        assert sorted(rows) == sorted(events)
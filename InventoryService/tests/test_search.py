@@ -0,0 +1,65 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.search import InvalidSearch, decode_cursor, encode_cursor, fts_query, search_products
+from app.shards import ShardRouter
+
+
+def test_every_word_must_match_and_the_last_is_a_prefix():
+    assert fts_query('blue widg') == '"blue" "widg"*'
+
+
+def test_operators_in_the_text_are_taken_literally():
+    assert fts_query('NOT "red" OR blue-*') == '"NOT" "red" "OR" "blue"*'
+
+
+def test_text_without_words_is_rejected():
+    with pytest.raises(InvalidSearch):
+        fts_query(' "* - ')
+
+
+def test_cursor_round_trip_and_garbage():
+    assert decode_cursor(encode_cursor(-1.25, 42)) == (-1.25, 42)
+    with pytest.raises(InvalidSearch):
+        decode_cursor('not a cursor')
+
+
+def test_search_pages_through_every_shard(tmp_path):
+    router = ShardRouter(count=2, data_dir=str(tmp_path))
+    router.init_db()
+
+    async def run():
+        for name in ['Blue widget', 'Red widget', 'Blue wide hat', 'Blue widget pro', 'Green gadget']:
+            await router.insert_product(1, name, 1.0, 5)
+        first = await search_products(router, 'blue wid', limit=2)
+        second = await search_products(router, 'blue wid', limit=2, cursor=first['nextCursor'])
+        await router.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    names = [r['productName'] for r in first['results'] + second['results']]
+    assert sorted(names) == ['Blue wide hat', 'Blue widget', 'Blue widget pro']
+    assert second['nextCursor'] is None
+    assert {r['id'] % 2 for r in first['results'] + second['results']} == {0, 1}
+
+
+def test_renamed_product_is_found_by_its_new_name(tmp_path):
+    router = ShardRouter(count=1, data_dir=str(tmp_path))
+    router.init_db()
+    conn = sqlite3.connect(router.paths[0])
+    conn.execute("INSERT INTO products (merchantId, productName, price, quantity) VALUES (1, 'Old name', 1, 1)")
+    conn.execute("UPDATE products SET productName = 'Shiny lamp'")
+    conn.commit()
+    conn.close()
+
+    async def run():
+        try:
+            return await search_products(router, 'old'), await search_products(router, 'lamp')
+        finally:
+            await router.close()
+
+    old, new = asyncio.run(run())
+    assert old['results'] == []
+    assert [r['productName'] for r in new['results']] == ['Shiny lamp']
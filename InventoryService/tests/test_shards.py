@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app import main
+from app.shards import ShardLayoutError, ShardRouter, check_layout, create_schema, shard_path
+
+# products as created before sharding, search and row versions
+BASELINE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        merchantId INTEGER NOT NULL,
+        productName TEXT NOT NULL,
+        price REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        reserved INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def test_new_products_go_round_robin_and_keep_their_shard(tmp_path):
+    router = ShardRouter(count=3, data_dir=str(tmp_path))
+    router.init_db()
+
+    async def run():
+        try:
+            return [await router.insert_product(1, f'p{i}', 1.0, 1) for i in range(6)]
+        finally:
+            await router.close()
+
+    ids = asyncio.run(run())
+    assert ids == [1, 2, 3, 4, 5, 6]
+    for product_id in ids:
+        conn = sqlite3.connect(router.path_for(product_id))
+        assert conn.execute('SELECT 1 FROM products WHERE id = ?', (product_id,)).fetchone() == (1,)
+        conn.close()
+
+
+def test_files_from_another_shard_count_are_refused(tmp_path):
+    ShardRouter(count=2, data_dir=str(tmp_path)).init_db()
+    with pytest.raises(ShardLayoutError):
+        check_layout(str(tmp_path), 1)
+    with pytest.raises(ShardLayoutError):
+        ShardRouter(count=3, data_dir=str(tmp_path)).init_db()
+
+
+def test_upgrade_from_baseline_database(tmp_path):
+    path = shard_path(0, 1, str(tmp_path))
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO products (merchantId, productName, price, quantity) VALUES (1, 'Blue lamp', 5, 3)")
+    conn.commit()
+
+    create_schema(conn, 0, 1)
+
+    assert conn.execute("SELECT rowid FROM products_fts WHERE products_fts MATCH 'lamp'").fetchall() == [(1,)]
+    assert conn.execute('SELECT version FROM products').fetchone() == (1,)
+    conn.execute('UPDATE products SET reserved = 1')
+    assert conn.execute('SELECT version FROM products').fetchone() == (2,)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'processed_payment_events', 'shard_info'} <= tables
+    conn.close()
+
+
+def test_payment_event_is_applied_once(tmp_path, monkeypatch):
+    router = ShardRouter(count=2, data_dir=str(tmp_path))
+    router.init_db()
+    monkeypatch.setattr(main, 'shards', router)
+    conn = sqlite3.connect(router.path_for(3))
+    conn.execute("INSERT INTO products (id, merchantId, productName, price, quantity, reserved) VALUES (3, 1, 'p', 1, 10, 2)")
+    conn.commit()
+
+    event = {'id': 11, 'productId': 3}
+    assert main.handle_payment_event(event, payment_success=True)
+    assert not main.handle_payment_event(event, payment_success=True)
+    assert main.handle_payment_event({'id': 12, 'productId': 3}, payment_success=False)
+
+    assert conn.execute('SELECT quantity, reserved FROM products WHERE id = 3').fetchone() == (9, 0)
+    conn.close()
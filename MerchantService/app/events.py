@@ -0,0 +1,98 @@
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, JSON always works
+    msgpack = None
+
+SCHEMA_VERSION = 1
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+EVENT_TYPE_HEADER = 'x-event-type'
+EVENT_VERSION_HEADER = 'x-event-version'
+
+# Fields MerchantService needs for its sales counters
+SALE_FIELDS = ('id', 'productId', 'merchantId', 'discount', 'unitPrice', 'createdAt')
+
+# Fields each consumer queue receives. Card data only goes to PaymentService.
+# PaymentService passes the order on in its payment events, so order_created
+# carries the sale fields through to merchant.payment_*.
+ROUTES = {
+    'order_created': {
+        'order_created': ('id', 'productId', 'merchantId', 'buyerId', 'creditCard', 'discount', 'unitPrice', 'createdAt'),
+        'email.order_created': ('id', 'productId', 'merchantId', 'buyerId', 'discount'),
+        'merchant.order_created': SALE_FIELDS,
+    },
+    'payment_success': {
+        'payment_success': ('id', 'productId'),
+        'email.payment_success': ('id', 'productId', 'merchantId', 'buyerId'),
+        'merchant.payment_success': SALE_FIELDS,
+    },
+    'payment_failed': {
+        'payment_failed': ('id', 'productId'),
+        'email.payment_failed': ('id', 'productId', 'merchantId', 'buyerId'),
+        'merchant.payment_failed': SALE_FIELDS,
+    },
+}
+
+
+def default_content_type():
+    if os.getenv('EVENT_ENCODING', 'json') == 'msgpack' and msgpack is not None:
+        return MSGPACK
+    return JSON
+
+
+def project(data, fields):
+    return {field: data[field] for field in fields if field in data}
+
+
+def encode_event(event_type, data, content_type=None):
+    """Return (body, properties) for one event"""
+    content_type = content_type or default_content_type()
+    if content_type == MSGPACK:
+        body = msgpack.packb(data, use_bin_type=True)
+    else:
+        content_type = JSON
+        body = json.dumps(data)
+    return body, {
+        'content_type': content_type,
+        'headers': {
+            EVENT_TYPE_HEADER: event_type,
+            EVENT_VERSION_HEADER: SCHEMA_VERSION,
+        },
+    }
+
+
+def decode_event(body, properties=None):
+    """Decode a message body by its content_type. Untagged messages are legacy JSON (v1)"""
+    properties = properties or {}
+    headers = properties.get('headers') or {}
+    version = int(headers.get(EVENT_VERSION_HEADER, 1))
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"Unsupported event version {version}")
+    if properties.get('content_type') == MSGPACK:
+        if msgpack is None:
+            raise ValueError("Received msgpack event but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+
+def event_type_of(queue, properties=None):
+    headers = (properties or {}).get('headers') or {}
+    return headers.get(EVENT_TYPE_HEADER) or queue.split('.')[-1]
+
+
+def queues_for(event_type):
+    return list(ROUTES[event_type])
+
+
+def publish_event(transport, event_type, data, headers=None, content_type=None):
+    """Publish one event to every consumer queue, each with its own projection"""
+    for queue, fields in ROUTES[event_type].items():
+        body, properties = encode_event(event_type, project(data, fields), content_type)
+        if headers:
+            properties['headers'].update(headers)
+        transport.publish(queue, body, properties)
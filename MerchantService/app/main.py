@@ -1,9 +1,42 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+import asyncio
 import sqlite3
 import os
+import time
+from typing import Optional
 from app.models import MerchantCreate, MerchantResponse
+from app.concurrency import limit_concurrency
+from app.conditional import cache_headers, ensure_row_version, etag_matches, entity_tag, not_modified
+from app.consumer import Consumer, PermanentError
+from app.db import Database
+from app.events import decode_event, event_type_of
+from app.leader import LeaderConsumer
+from app.debug import add_debug_routes
+from app.metrics import instrument_app, track_dependency, track_message, slow_log
+from app.sales import DAY, HOUR, apply_sale_event, create_schema, merchant_stats, parse_time, prune_processed_events
+from app.tracing import consumer_span, init_tracing, trace_requests
+from app.transport import create_transport
 
-app = FastAPI(title="Merchant Service")
+db = Database('merchants.db')
+
+# Order and payment events feeding the sales counters
+SALES_QUEUES = ['merchant.order_created', 'merchant.payment_success', 'merchant.payment_failed']
+
+@asynccontextmanager
+async def lifespan(app):
+    consumer = LeaderConsumer(create_transport, run_sales_consumer)
+    consumer.start()
+    yield
+    await asyncio.to_thread(consumer.stop)
+    await db.close()
+
+app = FastAPI(title="Merchant Service", lifespan=lifespan)
+limit_concurrency(app)
+instrument_app(app)
+add_debug_routes(app, slow_log)
+trace_requests(app)
+init_tracing('merchant-service')
 
 # Database setup
 def init_db():
@@ -20,6 +53,8 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    ensure_row_version(conn, 'merchants', ['name', 'ssn', 'email', 'phoneNumber', 'allowsDiscount'])
+    create_schema(conn)
     conn.commit()
     conn.close()
 
@@ -27,38 +62,42 @@ def init_db():
 init_db()
 
 @app.post("/merchants", status_code=201)
-def create_merchant(merchant: MerchantCreate):
-    conn = sqlite3.connect('merchants.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO merchants (name, ssn, email, phoneNumber, allowsDiscount)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        merchant.name,
-        merchant.ssn,
-        merchant.email,
-        merchant.phoneNumber,
-        merchant.allowsDiscount
-    ))
-    
-    merchant_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+async def create_merchant(merchant: MerchantCreate):
+    with track_dependency('sqlite', 'insert_merchant'):
+        cursor = await db.execute('''
+            INSERT INTO merchants (name, ssn, email, phoneNumber, allowsDiscount)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            merchant.name,
+            merchant.ssn,
+            merchant.email,
+            merchant.phoneNumber,
+            merchant.allowsDiscount
+        ))
     
-    return {"id": merchant_id}
+    return {"id": cursor.lastrowid}
 
 @app.get("/merchants/{merchant_id}")
-def get_merchant(merchant_id: int):
-    conn = sqlite3.connect('merchants.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT name, ssn, email, phoneNumber, allowsDiscount FROM merchants WHERE id = ?', (merchant_id,))
-    merchant_row = cursor.fetchone()
-    conn.close()
+async def get_merchant(merchant_id: int, response: Response, if_none_match: Optional[str] = Header(None)):
+    # Revalidation only needs the row version
+    if if_none_match:
+        with track_dependency('sqlite', 'select_merchant_version'):
+            version_row = await db.fetchone(
+                'SELECT version, updated_at, created_at FROM merchants WHERE id = ?', (merchant_id,)
+            )
+        if version_row and etag_matches(if_none_match, entity_tag(merchant_id, version_row[0])):
+            return not_modified(cache_headers(merchant_id, *version_row))
+
+    with track_dependency('sqlite', 'select_merchant'):
+        merchant_row = await db.fetchone(
+            'SELECT name, ssn, email, phoneNumber, allowsDiscount, version, updated_at, created_at FROM merchants WHERE id = ?',
+            (merchant_id,)
+        )
     
     if not merchant_row:
         raise HTTPException(status_code=404, detail="Merchant not found")
     
+    response.headers.update(cache_headers(merchant_id, *merchant_row[5:]))
     return MerchantResponse(
         name=merchant_row[0],
         ssn=merchant_row[1],
@@ -67,8 +106,42 @@ def get_merchant(merchant_id: int):
         allowsDiscount=bool(merchant_row[4])
     )
 
+def run_sales_consumer(transport):
+    prune_processed_events('merchants.db')
+
+    # Errors go to the retry/dead-letter queues, see consumer.py
+    def callback(queue, body, properties):
+        with track_message(queue), consumer_span(queue, properties):
+            try:
+                event_data = decode_event(body, properties)
+            except ValueError as e:
+                raise PermanentError(str(e)) from e
+            with track_dependency('sqlite', 'update_sales_counters'):
+                apply_sale_event('merchants.db', event_type_of(queue, properties), event_data)
+
+    Consumer(transport, callback).consume(SALES_QUEUES)
+
+@app.get("/merchants/{merchant_id}/stats")
+async def get_merchant_stats(
+    merchant_id: int,
+    from_: Optional[str] = Query(None, alias='from'),
+    to: Optional[str] = None,
+    bucket: str = Query('day', pattern='^(day|hour)$')
+):
+    # Defaults to today so far (UTC)
+    now = int(time.time())
+    try:
+        start = parse_time(from_, now - now % DAY)
+        end = parse_time(to, now + 1)
+    except (ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail="from and to must be ISO dates/times or epoch seconds")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="to must be after from")
+    with track_dependency('sqlite', 'select_merchant_stats'):
+        return await merchant_stats(db, merchant_id, start, end, DAY if bucket == 'day' else HOUR)
+
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+HOUR = 3600
+DAY = 86400
+# How long handled order ids are remembered for dropping redelivered events
+PROCESSED_RETENTION_SECONDS = 7 * DAY
+
+SCHEMA = [
+    # One row per merchant, product and hour (UTC); days are summed from hours
+    '''
+    CREATE TABLE IF NOT EXISTS sales_hourly (
+        merchantId INTEGER NOT NULL,
+        productId INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        orderedRevenue REAL NOT NULL DEFAULT 0,
+        paid INTEGER NOT NULL DEFAULT 0,
+        paidRevenue REAL NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (merchantId, hour, productId)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS processed_sale_events (
+        eventType TEXT NOT NULL,
+        orderId INTEGER NOT NULL,
+        processedAt INTEGER NOT NULL,
+        PRIMARY KEY (eventType, orderId)
+    ) WITHOUT ROWID
+    ''',
+]
+
+COUNTERS = ('orders', 'orderedRevenue', 'paid', 'paidRevenue', 'failed')
+
+UPSERT_SQL = '''
+    INSERT INTO sales_hourly (merchantId, productId, hour, orders, orderedRevenue, paid, paidRevenue, failed)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (merchantId, hour, productId) DO UPDATE SET
+        orders = orders + excluded.orders,
+        orderedRevenue = orderedRevenue + excluded.orderedRevenue,
+        paid = paid + excluded.paid,
+        paidRevenue = paidRevenue + excluded.paidRevenue,
+        failed = failed + excluded.failed
+'''
+
+
+def create_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def increments(event_type, revenue):
+    """(orders, orderedRevenue, paid, paidRevenue, failed) for one event"""
+    if event_type == 'order_created':
+        return 1, revenue, 0, 0.0, 0
+    if event_type == 'payment_success':
+        return 0, 0.0, 1, revenue, 0
+    if event_type == 'payment_failed':
+        return 0, 0.0, 0, 0.0, 1
+    raise ValueError(f"Not a sales event: {event_type}")
+
+
+def apply_sale_event(db_path, event_type, event):
+    """Count one order or payment event. Returns False for an event already counted.
+
+    Events are bucketed by the hour the order was placed, so an order and its
+    payment land in the same row.
+    """
+    created_at = int(event.get('createdAt') or time.time())
+    revenue = round(float(event.get('unitPrice') or 0.0) * (1 - float(event.get('discount') or 0.0)), 2)
+    row = (event['merchantId'], event['productId'], created_at - created_at % HOUR) + increments(event_type, revenue)
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO processed_sale_events (eventType, orderId, processedAt) VALUES (?, ?, ?)',
+                (event_type, event['id'], int(time.time()))
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.execute(UPSERT_SQL, row)
+    finally:
+        conn.close()
+    return True
+
+
+def prune_processed_events(db_path, now=None):
+    now = now or time.time()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            conn.execute('DELETE FROM processed_sale_events WHERE processedAt < ?', (int(now - PROCESSED_RETENTION_SECONDS),))
+    finally:
+        conn.close()
+
+
+def parse_time(value, default):
+    """Epoch seconds from an ISO date/datetime or a number; naive times are UTC"""
+    if value is None:
+        return default
+    try:
+        epoch = int(float(value))
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+    # Reject numbers the response dates (and SQLite) can't hold
+    iso(epoch)
+    return epoch
+
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def totals(row):
+    return {name: (round(value, 2) if isinstance(value, float) else value) for name, value in zip(COUNTERS, row)}
+
+
+async def merchant_stats(db, merchant_id, start, end, bucket_seconds):
+    """Counters for [start, end) by bucket and by product, read from sales_hourly only"""
+    sums = ', '.join(f'SUM({name})' for name in COUNTERS)
+    where = 'WHERE merchantId = ? AND hour >= ? AND hour < ?'
+    params = (merchant_id, start - start % HOUR, end)
+
+    buckets = await db.fetchall(
+        f'SELECT hour - hour % ? AS bucket, {sums} FROM sales_hourly {where} GROUP BY bucket ORDER BY bucket',
+        (bucket_seconds,) + params
+    )
+    products = await db.fetchall(
+        f'SELECT productId, {sums} FROM sales_hourly {where} GROUP BY productId ORDER BY SUM(paidRevenue) DESC',
+        params
+    )
+    overall = await db.fetchone(f'SELECT {sums} FROM sales_hourly {where}', params)
+    return {
+        "merchantId": merchant_id,
+        "from": iso(start),
+        "to": iso(end),
+        "bucket": 'day' if bucket_seconds == DAY else 'hour',
+        "totals": totals(tuple(value or 0 for value in overall)),
+        "buckets": [dict(start=iso(row[0]), **totals(row[1:])) for row in buckets],
+        "products": [dict(productId=row[0], **totals(row[1:])) for row in products],
+    }
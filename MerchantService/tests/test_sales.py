@@ -0,0 +1,55 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.db import Database
+from app.sales import DAY, HOUR, apply_sale_event, create_schema, merchant_stats, parse_time
+
+CREATED_AT = 1714561200  # 2024-05-01 11:00 UTC
+ORDER = {'id': 1, 'productId': 5, 'merchantId': 2, 'unitPrice': 10.0, 'discount': 0.1, 'createdAt': CREATED_AT + 120}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'merchants.db')
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def stats(db_path, start, end, bucket):
+    async def run():
+        db = Database(db_path)
+        try:
+            return await merchant_stats(db, 2, start, end, bucket)
+        finally:
+            await db.close()
+    return asyncio.run(run())
+
+
+def test_order_and_payment_land_in_the_order_hour_once(db_path):
+    assert apply_sale_event(db_path, 'order_created', ORDER)
+    assert not apply_sale_event(db_path, 'order_created', ORDER)
+    assert apply_sale_event(db_path, 'payment_success', ORDER)
+    assert apply_sale_event(db_path, 'payment_failed', dict(ORDER, id=2))
+
+    result = stats(db_path, CREATED_AT - CREATED_AT % DAY, CREATED_AT + DAY, HOUR)
+    assert result['totals'] == {'orders': 1, 'orderedRevenue': 9.0, 'paid': 1, 'paidRevenue': 9.0, 'failed': 1}
+    assert [bucket['start'] for bucket in result['buckets']] == ['2024-05-01T11:00:00+00:00']
+    assert [product['productId'] for product in result['products']] == [5]
+
+
+def test_parse_time():
+    assert parse_time(None, 7) == 7
+    assert parse_time('1714561200', 0) == 1714561200
+    assert parse_time('2024-05-01', 0) == 1714521600
+    assert parse_time('2024-05-01T02:00:00+02:00', 0) == 1714521600
+
+
+@pytest.mark.parametrize('value', ['inf', 'nan', '1e300', '99999999999999999999', 'May 1st'])
+def test_parse_time_rejects_what_it_cannot_represent(value):
+    with pytest.raises((ValueError, OverflowError, OSError)):
+        parse_time(value, 0)
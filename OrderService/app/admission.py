@@ -0,0 +1,145 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+
+from app.metrics import registry
+
+# Shed new orders while more than this many order_created events wait for PaymentService
+QUEUE_DEPTH_LIMIT = int(os.getenv('QUEUE_DEPTH_LIMIT', '1000'))
+QUEUE_POLL_SECONDS = float(os.getenv('QUEUE_POLL_SECONDS', '2'))
+# Token buckets, 0 turns a limiter off
+BUYER_RATE_PER_SECOND = float(os.getenv('BUYER_RATE_PER_SECOND', '5'))
+BUYER_BURST = int(os.getenv('BUYER_BURST', '10'))
+MERCHANT_RATE_PER_SECOND = float(os.getenv('MERCHANT_RATE_PER_SECOND', '50'))
+MERCHANT_BURST = int(os.getenv('MERCHANT_BURST', '100'))
+MAX_RETRY_AFTER_SECONDS = 60
+
+QUEUE_DEPTH = Gauge(
+    'broker_queue_depth',
+    'Messages waiting in a broker queue, from passive declares',
+    ['queue'],
+    registry=registry,
+)
+ADMISSION_REJECTIONS = Counter(
+    'admission_rejections_total',
+    'Orders turned away with 429 before any work was done',
+    ['reason'],
+    registry=registry,
+)
+
+
+def too_many_requests(reason, detail, retry_after):
+    ADMISSION_REJECTIONS.labels(reason).inc()
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(min(MAX_RETRY_AFTER_SECONDS, max(1, int(math.ceil(retry_after)))))}
+    )
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Returns 0 if a token was taken, otherwise seconds until one is free"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class KeyedRateLimiter:
+    """One token bucket per key, keeping the most recently used keys"""
+
+    def __init__(self, name, rate, burst, max_keys=10000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    def check(self, key):
+        if self.rate <= 0:
+            return
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        wait = bucket.take()
+        if wait:
+            raise too_many_requests(self.name, f"Too many orders for this {self.name}", wait)
+
+
+class QueueDepthMonitor:
+    """Polls the depth of one queue in the background and sheds load above a limit"""
+
+    def __init__(self, client, queue, limit=QUEUE_DEPTH_LIMIT, interval=QUEUE_POLL_SECONDS):
+        self.client = client
+        self.queue = queue
+        self.limit = limit
+        self.interval = interval
+        self.depth = None
+        self.drain_rate = None
+        self._last = None  # (monotonic time, depth) of the last successful read
+        self._task = None
+
+    def start(self):
+        if self.limit > 0:
+            self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _poll(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep polling; a failed read means the depth is unknown, not unchanged
+                print(f"Reading depth of {self.queue} failed: {e}")
+                self.depth = None
+                self._last = None
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        depth = await self.client.queue_depth_async(self.queue)
+        now = time.monotonic()
+        if depth is not None:
+            QUEUE_DEPTH.labels(self.queue).set(depth)
+            if self._last is not None and depth < self._last[1]:
+                # Only a falling depth says how fast the consumer catches up
+                self.drain_rate = (self._last[1] - depth) / (now - self._last[0])
+        self.depth = depth
+        self._last = (now, depth) if depth is not None else None
+
+    def stale(self):
+        """No successful read for several intervals, e.g. a probe stuck on a dead broker"""
+        return self._last is None or time.monotonic() - self._last[0] > 3 * self.interval
+
+    def check(self):
+        # Unknown depth (broker unreachable) lets orders through, as before
+        if self.limit <= 0 or self.depth is None or self.depth <= self.limit or self.stale():
+            return
+        excess = self.depth - self.limit
+        retry_after = excess / self.drain_rate if self.drain_rate else self.interval
+        raise too_many_requests("queue_depth", "Order processing is behind, try again later", retry_after)
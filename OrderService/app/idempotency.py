@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from fastapi import HTTPException
+
+from app.metrics import track_dependency
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', '100000'))
+# How long a duplicate waits for the first request before getting 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10'))
+# A claim this old with no response is taken to be from a crashed process
+PENDING_TIMEOUT_SECONDS = 60
+PURGE_EVERY = 100
+
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        status_code INTEGER,
+        response TEXT,
+        created_at REAL NOT NULL
+    )
+'''
+CREATE_INDEX = 'CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at)'
+
+
+def fingerprint(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Idempotency-Key claims and stored responses, kept in the service database"""
+
+    def __init__(self, db, ttl=IDEMPOTENCY_TTL_SECONDS, max_keys=IDEMPOTENCY_MAX_KEYS, wait=IDEMPOTENCY_WAIT_SECONDS):
+        self.db = db
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.wait = wait
+        self._claims = 0
+        # Requests in this process that own a key, so duplicates can wait without polling
+        self._in_flight = {}
+
+    async def claim(self, key, request_fingerprint):
+        """Returns (status_code, body) to replay, or None once the caller owns the key"""
+        give_up_at = time.monotonic() + self.wait
+        while True:
+            now = time.time()
+            with track_dependency('sqlite', 'claim_idempotency_key'):
+                cursor = await self.db.execute(
+                    'INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, created_at) VALUES (?, ?, ?)',
+                    (key, request_fingerprint, now)
+                )
+            if cursor.rowcount == 1:
+                self._in_flight[key] = asyncio.Event()
+                await self._maybe_purge(now)
+                return None
+
+            row = await self.db.fetchone(
+                'SELECT fingerprint, status_code, response, created_at FROM idempotency_keys WHERE key = ?', (key,)
+            )
+            if row is None:
+                continue
+            stored_fingerprint, status_code, response, created_at = row
+            if created_at < now - self.ttl or (status_code is None and created_at < now - PENDING_TIMEOUT_SECONDS):
+                await self.db.execute('DELETE FROM idempotency_keys WHERE key = ? AND created_at = ?', (key, created_at))
+                continue
+            if stored_fingerprint != request_fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was used for a different request")
+            if status_code is not None:
+                return status_code, json.loads(response)
+
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": "1"}
+                )
+            event = self._in_flight.get(key)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                else:
+                    # Owned by another worker process
+                    await asyncio.sleep(min(0.05, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    async def complete(self, key, status_code, body):
+        with track_dependency('sqlite', 'store_idempotent_response'):
+            await self.db.execute(
+                'UPDATE idempotency_keys SET status_code = ?, response = ? WHERE key = ?',
+                (status_code, json.dumps(body), key)
+            )
+        self._wake(key)
+
+    async def release(self, key):
+        """Forget a claim whose outcome should not be replayed, e.g. a 503"""
+        await self.db.execute('DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL', (key,))
+        self._wake(key)
+
+    def _wake(self, key):
+        event = self._in_flight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    async def _maybe_purge(self, now):
+        self._claims += 1
+        if self._claims % PURGE_EVERY:
+            return
+        with track_dependency('sqlite', 'purge_idempotency_keys'):
+            await self.db.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (now - self.ttl,))
+            await self.db.execute('''
+                DELETE FROM idempotency_keys WHERE key IN (
+                    SELECT key FROM idempotency_keys WHERE status_code IS NOT NULL
+                    ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_keys,))
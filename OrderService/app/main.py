@@ -1,151 +1,229 @@
-from fastapi import FastAPI, HTTPException
-import requests
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+import asyncio
+import httpx
 import os
 import sqlite3
+import time
+from typing import Optional
 from app.models import OrderCreate, OrderResponse
 from app.rabbitmq_client import RabbitMQClient
-
-app = FastAPI(title="Order Service")
+from app.admission import KeyedRateLimiter, QueueDepthMonitor, BUYER_RATE_PER_SECOND, BUYER_BURST, MERCHANT_RATE_PER_SECOND, MERCHANT_BURST
+from app.concurrency import limit_concurrency
+from app.db import Database
+from app.idempotency import CREATE_INDEX, CREATE_TABLE, IdempotencyStore, fingerprint
+from app.debug import add_debug_routes
+from app.http_cache import ResponseCache
+from app.metrics import instrument_app, track_dependency, slow_log
+from app.order_store import OrderStore, timestamp_bound
+from app.partitions import ARCHIVE_CHECK_SECONDS
+from app.resilience import Dependency, DependencyUnavailable, deadline, first_error
+from app.tracing import init_tracing, outbound_headers, trace_requests
 
 # Environment variables
 MERCHANT_SERVICE_URL = os.getenv('MERCHANT_SERVICE_URL', 'http://merchant-service:8001')
-BUYER_SERVICE_URL = os.getenv('BUYER_SERVICE_URL', 'http://buyer-service:8002') 
+BUYER_SERVICE_URL = os.getenv('BUYER_SERVICE_URL', 'http://buyer-service:8002')
 INVENTORY_SERVICE_URL = os.getenv('INVENTORY_SERVICE_URL', 'http://inventory-service:8003')
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+# Time budget shared by every dependency call made for one request
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '5'))
 
 rabbitmq_client = RabbitMQClient()
+DB_PATH = 'orders.db'
+db = Database(DB_PATH)
+orders = OrderStore(db)
+idempotency = IdempotencyStore(db)
+http_client = None
+
+# Merchants, buyers and products are revalidated with If-None-Match instead of refetched
+merchant_service = Dependency('merchant-service', MERCHANT_SERVICE_URL, lambda: http_client, cache=ResponseCache())
+buyer_service = Dependency('buyer-service', BUYER_SERVICE_URL, lambda: http_client, cache=ResponseCache())
+inventory_service = Dependency('inventory-service', INVENTORY_SERVICE_URL, lambda: http_client, cache=ResponseCache())
+DEPENDENCIES = [merchant_service, buyer_service, inventory_service]
+
+order_backlog = QueueDepthMonitor(rabbitmq_client, 'order_created')
+buyer_limiter = KeyedRateLimiter('buyer', BUYER_RATE_PER_SECOND, BUYER_BURST)
+merchant_limiter = KeyedRateLimiter('merchant', MERCHANT_RATE_PER_SECOND, MERCHANT_BURST)
 
-# Database setup
+@asynccontextmanager
+async def lifespan(app):
+    global http_client
+    # Timeouts come from the request deadline, see app.resilience
+    http_client = httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS))
+    order_backlog.start()
+    archiver = asyncio.create_task(archive_cold_orders())
+    yield
+    archiver.cancel()
+    await order_backlog.stop()
+    await http_client.aclose()
+    await db.close()
+
+app = FastAPI(title="Order Service", lifespan=lifespan)
+limit_concurrency(app)
+instrument_app(app)
+add_debug_routes(app, slow_log)
+trace_requests(app)
+init_tracing('order-service')
+
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable_handler(request: Request, exc: DependencyUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"{exc.dependency} is unavailable", "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# Database setup. Orders live in monthly partitions, see app.order_store
 def init_db():
-    conn = sqlite3.connect('orders.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            productId INTEGER NOT NULL,
-            merchantId INTEGER NOT NULL,
-            buyerId INTEGER NOT NULL,
-            cardNumber TEXT NOT NULL,
-            expirationMonth INTEGER NOT NULL,
-            expirationYear INTEGER NOT NULL,
-            cvc INTEGER NOT NULL,
-            discount REAL DEFAULT 0.0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    orders.init_db(conn)
+    cursor.execute(CREATE_TABLE)
+    cursor.execute(CREATE_INDEX)
     conn.commit()
     conn.close()
 
 init_db()
 
-def check_merchant_exists(merchant_id: int) -> bool:
-    try:
-        response = requests.get(f"{MERCHANT_SERVICE_URL}/merchants/{merchant_id}")
-        return response.status_code == 200
-    except:
-        return False
+async def archive_cold_orders():
+    """Move partitions that have left the hot window to archive files"""
+    while True:
+        try:
+            await orders.archive(DB_PATH)
+        except Exception as e:
+            print(f"Archiving orders failed: {e}")
+        await asyncio.sleep(ARCHIVE_CHECK_SECONDS)
 
-def check_buyer_exists(buyer_id: int) -> bool:
-    try:
-        response = requests.get(f"{BUYER_SERVICE_URL}/buyers/{buyer_id}")
-        return response.status_code == 200
-    except:
-        return False
+# Transport failures raise DependencyUnavailable (503) instead of looking
+# like a missing merchant/buyer/product
+async def check_merchant_exists(merchant_id: int) -> bool:
+    with track_dependency('http', 'check_merchant_exists'):
+        response = await merchant_service.get(f"/merchants/{merchant_id}", headers=outbound_headers())
+    return response.status_code == 200
 
-def check_product_exists(product_id: int) -> bool:
-    try:
-        response = requests.get(f"{INVENTORY_SERVICE_URL}/products/{product_id}")
-        return response.status_code == 200
-    except:
-        return False
+async def check_buyer_exists(buyer_id: int) -> bool:
+    with track_dependency('http', 'check_buyer_exists'):
+        response = await buyer_service.get(f"/buyers/{buyer_id}", headers=outbound_headers())
+    return response.status_code == 200
 
-def check_product_belongs_to_merchant(product_id: int, merchant_id: int) -> bool:
-    try:
-        response = requests.get(f"{INVENTORY_SERVICE_URL}/products/{product_id}")
-        if response.status_code == 200:
-            product_data = response.json()
-            return product_data.get('merchantId') == merchant_id
-        return False
-    except:
-        return False
-
-def check_merchant_allows_discount(merchant_id: int) -> bool:
-    try:
-        response = requests.get(f"{MERCHANT_SERVICE_URL}/merchants/{merchant_id}")
-        if response.status_code == 200:
-            merchant_data = response.json()
-            return merchant_data.get('allowsDiscount', False)
-        return False
-    except:
-        return False
-
-def reserve_product(product_id: int) -> bool:
-    try:
-        response = requests.get(f"{INVENTORY_SERVICE_URL}/products/{product_id}")
-        if response.status_code == 200:
-            product_data = response.json()
-            return product_data.get('quantity', 0) > 0
-        return False
-    except:
-        return False
-
-def get_product_price(product_id: int) -> float:
-    try:
-        response = requests.get(f"{INVENTORY_SERVICE_URL}/products/{product_id}")
-        if response.status_code == 200:
-            product_data = response.json()
-            return product_data.get('price', 0.0)
-        return 0.0
-    except:
-        return 0.0
+async def fetch_product(product_id: int) -> Optional[dict]:
+    """The product, or None if it doesn't exist. One call covers existence, owner and price"""
+    with track_dependency('http', 'fetch_product'):
+        response = await inventory_service.get(f"/products/{product_id}", headers=outbound_headers())
+    if response.status_code == 200:
+        return response.json()
+    return None
+
+async def check_merchant_allows_discount(merchant_id: int) -> bool:
+    with track_dependency('http', 'check_merchant_allows_discount'):
+        response = await merchant_service.get(f"/merchants/{merchant_id}", headers=outbound_headers())
+    if response.status_code == 200:
+        merchant_data = response.json()
+        return merchant_data.get('allowsDiscount', False)
+    return False
+
+async def reserve_product(product_id: int) -> bool:
+    with track_dependency('http', 'reserve_product'):
+        response = await inventory_service.get(f"/products/{product_id}", headers=outbound_headers())
+    if response.status_code == 200:
+        product_data = response.json()
+        return product_data.get('quantity', 0) > 0
+    return False
+
+async def get_product_price(product_id: int) -> float:
+    with track_dependency('http', 'get_product_price'):
+        response = await inventory_service.get(f"/products/{product_id}", headers=outbound_headers())
+    if response.status_code == 200:
+        product_data = response.json()
+        return product_data.get('price', 0.0)
+    return 0.0
+
+async def require(check, detail):
+    """The check's result, or 400 with detail as soon as it comes back false"""
+    result = await check
+    if not result:
+        raise HTTPException(status_code=400, detail=detail)
+    return result
+
+async def no_discount_check() -> bool:
+    return True
 
 @app.post("/orders", status_code=201)
-def create_order(order: OrderCreate):
-    # Validatar hvort seljandi sé til
-    if not check_merchant_exists(order.merchantId):
-        raise HTTPException(status_code=400, detail="Merchant does not exist")
-    
-    # Validatar hvort kaupandi sé til
-    if not check_buyer_exists(order.buyerId):
-        raise HTTPException(status_code=400, detail="Buyer does not exist")
-    
-    # validatar hvort vara sé til
-    if not check_product_exists(order.productId):
-        raise HTTPException(status_code=400, detail="Product does not exist")
-    
-    # kjíkir hvort varan er í eigu merchant
-    if not check_product_belongs_to_merchant(order.productId, order.merchantId):
-        raise HTTPException(status_code=400, detail="Product does not belong to merchant")
-    
-    # Kíkjir hvor merchent leyfir Discount
-    if order.discount and order.discount > 0:
-        if not check_merchant_allows_discount(order.merchantId):
-            raise HTTPException(status_code=400, detail="Merchant does not allow discount")
-    
-    # geymir vöru
-    reservation_response = requests.post(f"{INVENTORY_SERVICE_URL}/products/{order.productId}/reserve")
-    if not (reservation_response.status_code == 200 and reservation_response.json().get('success')):
-        raise HTTPException(status_code=400, detail="Product is sold out")
-    
+async def create_order(order: OrderCreate, idempotency_key: Optional[str] = Header(None)):
+    if not idempotency_key:
+        return await place_order(order)
+
+    # A retry with the same key gets the first response back without any
+    # downstream calls; a concurrent duplicate waits for the first to finish
+    replay = await idempotency.claim(idempotency_key, fingerprint(order.dict()))
+    if replay:
+        status_code, body = replay
+        return JSONResponse(status_code=status_code, content=body, headers={"Idempotent-Replayed": "true"})
+
+    stored = False
+    try:
+        try:
+            result = await place_order(order)
+        except HTTPException as e:
+            # Validation failures are final; 429 means try again later
+            if 400 <= e.status_code < 500 and e.status_code != 429:
+                await idempotency.complete(idempotency_key, e.status_code, {"detail": e.detail})
+                stored = True
+            raise
+        await idempotency.complete(idempotency_key, 201, result)
+        stored = True
+        return result
+    finally:
+        # Anything else, including a cancelled request, must not leave the key pending
+        if not stored:
+            await asyncio.shield(idempotency.release(idempotency_key))
+
+async def place_order(order: OrderCreate):
+    # Turn orders away before anything is checked or reserved
+    buyer_limiter.check(order.buyerId)
+    merchant_limiter.check(order.merchantId)
+    order_backlog.check()
+
+    # The checks are independent so they run concurrently; the first one to
+    # fail decides the error and the others are cancelled
+    wants_discount = bool(order.discount and order.discount > 0)
+    with deadline(REQUEST_DEADLINE_SECONDS):
+        _, _, product, _ = await first_error(
+            # Validatar hvort seljandi sé til
+            require(check_merchant_exists(order.merchantId), "Merchant does not exist"),
+            # Validatar hvort kaupandi sé til
+            require(check_buyer_exists(order.buyerId), "Buyer does not exist"),
+            # validatar hvort vara sé til
+            require(fetch_product(order.productId), "Product does not exist"),
+            # Kíkjir hvor merchent leyfir Discount
+            require(check_merchant_allows_discount(order.merchantId), "Merchant does not allow discount")
+            if wants_discount else no_discount_check(),
+        )
+
+        # kjíkir hvort varan er í eigu merchant
+        if product.get('merchantId') != order.merchantId:
+            raise HTTPException(status_code=400, detail="Product does not belong to merchant")
+
+        # geymir vöru
+        with track_dependency('http', 'reserve_product_post'):
+            reservation_response = await inventory_service.post(f"/products/{order.productId}/reserve", headers=outbound_headers())
+        if not (reservation_response.status_code == 200 and reservation_response.json().get('success')):
+            raise HTTPException(status_code=400, detail="Product is sold out")
+
     # býr til order í db
-    conn = sqlite3.connect('orders.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO orders (productId, merchantId, buyerId, cardNumber, expirationMonth, expirationYear, cvc, discount)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        order.productId,
-        order.merchantId,
-        order.buyerId,
-        order.creditCard.cardNumber,
-        order.creditCard.expirationMonth,
-        order.creditCard.expirationYear,
-        order.creditCard.cvc,
-        order.discount or 0.0
-    ))
-    order_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    
+    with track_dependency('sqlite', 'insert_order'):
+        order_id = await orders.insert((
+            order.productId,
+            order.merchantId,
+            order.buyerId,
+            order.creditCard.cardNumber,
+            order.creditCard.expirationMonth,
+            order.creditCard.expirationYear,
+            order.creditCard.cvc,
+            order.discount or 0.0
+        ))
+
     # Try to publish RabbitMQ event, but don't fail if it doesn't work
     try:
         order_data = {
@@ -154,47 +232,86 @@ def create_order(order: OrderCreate):
             "merchantId": order.merchantId,
             "buyerId": order.buyerId,
             "creditCard": order.creditCard.dict(),
-            "discount": order.discount or 0.0
+            "discount": order.discount or 0.0,
+            # Price at order time, for the merchant sales counters
+            "unitPrice": product.get('price', 0.0),
+            "createdAt": int(time.time())
         }
-        rabbitmq_client.publish_order_created(order_data)
+        await rabbitmq_client.publish_order_created_async(order_data)
         print(f"Order {order_id} created and event published")
     except Exception as e:
         print(f"Order {order_id} created but RabbitMQ event failed: {e}")
         # Don't raise the exception - order was successfully created
-    
+
     return {"id": order_id}
 
+def mask_card(card_number: str) -> str:
+    return "**********" + card_number[-4:]
+
+@app.get("/orders")
+async def list_orders(
+    merchantId: Optional[int] = None,
+    buyerId: Optional[int] = None,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    before: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Newest first. Pass nextBefore back as before for the next page"""
+    try:
+        start = timestamp_bound(start) if start else None
+        end = timestamp_bound(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be ISO dates or datetimes")
+    with track_dependency('sqlite', 'list_orders'):
+        page, next_before, archived = await orders.list(merchantId, buyerId, start, end, before, limit)
+    return {
+        "orders": [
+            {
+                "id": row['id'],
+                "productId": row['productId'],
+                "merchantId": row['merchantId'],
+                "buyerId": row['buyerId'],
+                "cardNumber": mask_card(row['cardNumber']),
+                "discount": row['discount'],
+                "createdAt": row['created_at'],
+            }
+            for row in page
+        ],
+        "nextBefore": next_before,
+        # Partitions in the range that are only in archive files
+        "archived": archived,
+    }
+
 @app.get("/orders/{order_id}")
-def get_order(order_id: int):
-    conn = sqlite3.connect('orders.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM orders WHERE id = ?', (order_id,))
-    order_row = cursor.fetchone()
-    conn.close()
-    
+async def get_order(order_id: int):
+    with track_dependency('sqlite', 'select_order'):
+        order_row = await orders.get(order_id)
+
     if not order_row:
         raise HTTPException(status_code=404, detail="Order does not exist")
-    
-    # order row
-    product_price = get_product_price(order_row[1])  # productId
-    total_price = product_price * (1 - order_row[8])  # discount
-    
-    # Mask fyirr Card Number
-    card_number = order_row[4]  
-    masked_card = "**********" + card_number[-4:]
-    
+
+    with deadline(REQUEST_DEADLINE_SECONDS):
+        product_price = await get_product_price(order_row['productId'])
+    total_price = product_price * (1 - order_row['discount'])
+
     return OrderResponse(
-        productId=order_row[1],
-        merchantId=order_row[2],
-        buyerId=order_row[3],
-        cardNumber=masked_card,
+        productId=order_row['productId'],
+        merchantId=order_row['merchantId'],
+        buyerId=order_row['buyerId'],
+        # Mask fyirr Card Number
+        cardNumber=mask_card(order_row['cardNumber']),
         totalPrice=round(total_price, 2)
     )
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
+@app.get("/dependencies")
+async def dependency_status():
+    return {dep.name: dep.breaker.snapshot() for dep in DEPENDENCIES}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
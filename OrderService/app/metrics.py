@@ -0,0 +1,178 @@
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+
+# Own registry so several services can be loaded into one process (benchmarks)
+registry = CollectorRegistry()
+
+# Requests and messages at least this slow are kept in the slow log
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '0.5'))
+SLOW_LOG_SIZE = int(os.getenv('SLOW_LOG_SIZE', '100'))
+MAX_STAGES = 50
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route',
+    ['method', 'route', 'status'],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+DEPENDENCY_LATENCY = Histogram(
+    'dependency_duration_seconds',
+    'Latency of outbound HTTP calls, SQLite statements and AMQP publishes',
+    ['kind', 'name', 'outcome'],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+MESSAGES_CONSUMED = Counter(
+    'messages_consumed_total',
+    'Messages taken off a queue',
+    ['queue'],
+    registry=registry,
+)
+MESSAGES_FAILED = Counter(
+    'messages_failed_total',
+    'Messages whose handler raised',
+    ['queue'],
+    registry=registry,
+)
+MESSAGES_IN_FLIGHT = Gauge(
+    'messages_in_flight',
+    'Messages currently being handled',
+    ['queue'],
+    registry=registry,
+)
+
+# Dependency calls made while handling the current request or message
+_stages = contextvars.ContextVar('stages', default=None)
+
+
+class SlowLog:
+    """Ring buffer of recent requests and messages slower than a threshold,
+    each with the timed dependency calls (stages) made while handling it"""
+
+    def __init__(self, threshold=SLOW_REQUEST_SECONDS, size=SLOW_LOG_SIZE):
+        self.threshold = threshold
+        self._entries = deque(maxlen=size)
+
+    def record(self, kind, name, outcome, start, seconds, stages):
+        if seconds < self.threshold:
+            return
+        self._entries.append({
+            "kind": kind,
+            "name": name,
+            "outcome": outcome,
+            "at": time.time() - seconds,
+            "ms": round(seconds * 1000, 2),
+            "stages": [
+                {
+                    "stage": f"{stage_kind}:{stage_name}",
+                    "outcome": stage_outcome,
+                    "offsetMs": round((stage_start - start) * 1000, 2),
+                    "ms": round(stage_seconds * 1000, 2),
+                }
+                for stage_kind, stage_name, stage_outcome, stage_start, stage_seconds in stages
+            ],
+        })
+
+    def snapshot(self):
+        """Slowest first"""
+        return sorted(list(self._entries), key=lambda entry: entry["ms"], reverse=True)
+
+
+slow_log = SlowLog()
+
+
+@contextmanager
+def track_dependency(kind, name):
+    """Time one outbound call, e.g. track_dependency('http', 'check_buyer_exists')"""
+    stages = _stages.get()
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        DEPENDENCY_LATENCY.labels(kind, name, outcome).observe(elapsed)
+        if stages is not None and len(stages) < MAX_STAGES:
+            stages.append((kind, name, outcome, start, elapsed))
+
+
+@contextmanager
+def track_message(queue):
+    MESSAGES_CONSUMED.labels(queue).inc()
+    MESSAGES_IN_FLIGHT.labels(queue).inc()
+    stages = []
+    token = _stages.set(stages)
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        MESSAGES_FAILED.labels(queue).inc()
+        outcome = 'error'
+        raise
+    finally:
+        MESSAGES_IN_FLIGHT.labels(queue).dec()
+        _stages.reset(token)
+        slow_log.record('message', queue, outcome, start, time.perf_counter() - start, stages)
+
+
+def _route_template(app, scope):
+    from starlette.routing import Match
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+def instrument_app(app):
+    """Add per-route latency histograms and a /metrics endpoint to a FastAPI app"""
+    from fastapi import Request, Response
+
+    @app.middleware("http")
+    async def record_request_latency(request: Request, call_next):
+        stages = []
+        token = _stages.set(stages)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            _stages.reset(token)
+            route = _route_template(app, request.scope)
+            REQUEST_LATENCY.labels(request.method, route, str(status)).observe(elapsed)
+            if not route.startswith('/debug/'):
+                slow_log.record('http', f"{request.method} {route}", str(status), start, elapsed, stages)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics on a side port for the consumer-only services"""
+    port = int(port or os.getenv('METRICS_PORT', '9100'))
+    start_http_server(port, registry=registry)
+    print(f"Metrics available on :{port}/metrics")
@@ -0,0 +1,206 @@
+import asyncio
+import bisect
+import sqlite3
+from datetime import datetime, timezone
+
+from app.partitions import (
+    ARCHIVE_DIR, CATALOG_SQL, HOT_PARTITION_MONTHS, adopt_legacy_table, archive_cold_partitions,
+    find_in_archive, month_key, month_of_timestamp, partition_name,
+)
+
+BASE = 'orders'
+COLUMNS = ('id', 'productId', 'merchantId', 'buyerId', 'cardNumber', 'expirationMonth',
+           'expirationYear', 'cvc', 'discount', 'created_at')
+
+PARTITION_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        productId INTEGER NOT NULL,
+        merchantId INTEGER NOT NULL,
+        buyerId INTEGER NOT NULL,
+        cardNumber TEXT NOT NULL,
+        expirationMonth INTEGER NOT NULL,
+        expirationYear INTEGER NOT NULL,
+        cvc INTEGER NOT NULL,
+        discount REAL DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_{name}_merchant ON {name} (merchantId, id)',
+    'CREATE INDEX IF NOT EXISTS idx_{name}_buyer ON {name} (buyerId, id)',
+]
+
+# Ids stay unique across partitions: each one continues from the last id of
+# the partition before it
+INSERT_SQL = '''
+    INSERT INTO {name} (id, productId, merchantId, buyerId, cardNumber, expirationMonth, expirationYear, cvc, discount)
+    VALUES ((SELECT COALESCE(MAX(id), ?) + 1 FROM {name}), ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def timestamp_bound(value):
+    """An ISO date/datetime as an SQLite CURRENT_TIMESTAMP string (UTC)"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Partition:
+    def __init__(self, name, first_month, last_month, first_id, archive_path):
+        self.name = name
+        self.first_month = first_month
+        self.last_month = last_month
+        self.first_id = first_id
+        self.archive_path = archive_path
+
+    def overlaps(self, from_month, to_month):
+        return self.last_month >= from_month and self.first_month <= to_month
+
+
+class OrderStore:
+    """Orders in monthly tables (orders_YYYYMM) listed in a partitions catalog.
+
+    New orders go to the current month's table. Lookups by id find the
+    partition from the catalog's id ranges, which are cached in memory and
+    reloaded when an id or date range may be in a partition another worker
+    started since.
+    Partitions older than HOT_PARTITION_MONTHS are moved to NDJSON.gz files
+    by archive() and are still readable from there.
+    """
+
+    def __init__(self, db, archive_dir=ARCHIVE_DIR, hot_months=HOT_PARTITION_MONTHS):
+        self.db = db
+        self.archive_dir = archive_dir
+        self.hot_months = hot_months
+        self.partitions = []
+        self._lock = asyncio.Lock()
+
+    def init_db(self, conn):
+        conn.execute(CATALOG_SQL)
+        if adopt_legacy_table(conn, BASE):
+            # The listing indexes every partition has
+            for statement in PARTITION_SCHEMA[1:]:
+                conn.execute(statement.format(name=BASE))
+        self.partitions = self._load(conn.execute(self._catalog_sql()).fetchall())
+
+    @staticmethod
+    def _catalog_sql():
+        return ('SELECT name, first_month, last_month, first_id, archive_path FROM partitions '
+                f"WHERE base = '{BASE}' ORDER BY first_id")
+
+    @staticmethod
+    def _load(rows):
+        return [Partition(*row) for row in rows]
+
+    async def refresh(self):
+        self.partitions = self._load(await self.db.fetchall(self._catalog_sql()))
+
+    async def _current(self):
+        """The partition new orders go to, starting a new one when the month changes"""
+        month = month_key()
+        newest = self.partitions[-1] if self.partitions else None
+        if newest is not None and newest.last_month >= month:
+            return newest
+        name = partition_name(BASE, month)
+        for statement in PARTITION_SCHEMA:
+            await self.db.execute(statement.format(name=name))
+        if newest is None:
+            first_id = 1
+        else:
+            (last_id,) = await self.db.fetchone(f'SELECT MAX(id) FROM {newest.name}')
+            first_id = (last_id or newest.first_id - 1) + 1
+        await self.db.execute(
+            'INSERT OR IGNORE INTO partitions (name, base, first_month, last_month, first_id) VALUES (?, ?, ?, ?, ?)',
+            (name, BASE, month, month, first_id)
+        )
+        await self.refresh()
+        print(f"Started order partition {name} at id {first_id}")
+        return self.partitions[-1]
+
+    async def insert(self, values):
+        """Insert (productId, ..., discount) and return the new order id"""
+        # One insert at a time so ids and month rollover stay in step
+        async with self._lock:
+            partition = await self._current()
+            cursor = await self.db.execute(
+                INSERT_SQL.format(name=partition.name), (partition.first_id - 1,) + tuple(values)
+            )
+            return cursor.lastrowid
+
+    def partition_for(self, order_id):
+        index = bisect.bisect_right([p.first_id for p in self.partitions], order_id) - 1
+        return self.partitions[index] if index >= 0 else None
+
+    async def get(self, order_id):
+        """The order as a dict, from SQLite or its archive file, or None"""
+        for attempt in range(2):
+            partition = self.partition_for(order_id)
+            if partition is None:
+                return None
+            if partition.archive_path:
+                return await asyncio.to_thread(find_in_archive, partition.archive_path, order_id)
+            try:
+                row = await self.db.fetchone(f'SELECT * FROM {partition.name} WHERE id = ?', (order_id,))
+            except sqlite3.OperationalError:
+                if attempt:
+                    raise
+                # Archived and dropped since the catalog was cached
+                await self.refresh()
+                continue
+            if row is None and not attempt and partition is self.partitions[-1]:
+                # Another worker may have started a partition this one hasn't seen
+                await self.refresh()
+                if self.partition_for(order_id).name != partition.name:
+                    continue
+            return dict(zip(COLUMNS, row)) if row else None
+
+    async def list(self, merchant_id=None, buyer_id=None, start=None, end=None, before=None, limit=50):
+        """Newest first across the hot partitions in [start, end), with keyset paging on id"""
+        from_month = month_of_timestamp(start) if start else '000000'
+        to_month = month_of_timestamp(end) if end else '999999'
+        conditions, params = [], []
+        for column, value in (('merchantId', merchant_id), ('buyerId', buyer_id)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        if start:
+            conditions.append('created_at >= ?')
+            params.append(start)
+        if end:
+            conditions.append('created_at < ?')
+            params.append(end)
+
+        if not self.partitions or to_month > self.partitions[-1].last_month:
+            # The range reaches past the newest partition this worker knows of
+            await self.refresh()
+        orders, archived = [], []
+        for partition in reversed(self.partitions):
+            if not partition.overlaps(from_month, to_month):
+                continue
+            if partition.archive_path:
+                archived.append({"partition": partition.name, "path": partition.archive_path})
+                continue
+            if len(orders) > limit or (before is not None and partition.first_id >= before):
+                continue
+            where = conditions + (['id < ?'] if before is not None else [])
+            sql = f'SELECT * FROM {partition.name}'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += ' ORDER BY id DESC LIMIT ?'
+            rows = await self.db.fetchall(
+                sql, params + ([before] if before is not None else []) + [limit + 1 - len(orders)]
+            )
+            orders.extend(dict(zip(COLUMNS, row)) for row in rows)
+        page = orders[:limit]
+        return page, (page[-1]['id'] if len(orders) > limit else None), archived
+
+    def archive_sync(self, db_path):
+        return archive_cold_partitions(db_path, BASE, self.archive_dir, self.hot_months)
+
+    async def archive(self, db_path):
+        archived = await asyncio.to_thread(self.archive_sync, db_path)
+        if archived:
+            await self.refresh()
+        return archived
@@ -1,39 +1,138 @@
+import asyncio
+import contextvars
 import pika
-import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.events import publish_event, queues_for
+from app.metrics import track_dependency
+from app.tracing import message_headers
 
 class RabbitMQClient:
     def __init__(self):
         self.connection = None
         self.channel = None
+        # pika's BlockingConnection is not thread-safe, so every publish from
+        # the event loop goes through this one worker thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='amqp-publish')
+        # Depth reads use their own connection and thread, so a dead broker
+        # doesn't hold publishes up behind reconnect attempts
+        self.depth_probe = QueueDepthProbe()
         
     def connect(self):
+        # Never leave the previous connection open behind a new one
+        self._disconnect()
         try:
             self.connection = connection = pika.BlockingConnection(pika.ConnectionParameters(host='rabbitmq', port=5672))
             
             self.channel = self.connection.channel()
             #  lætur vit hvernig gengur
-            self.channel.queue_declare(queue='order_created')
-            self.channel.queue_declare(queue='payment_success')
-            self.channel.queue_declare(queue='payment_failed')
+            for queue in queues_for('order_created') + queues_for('payment_success') + queues_for('payment_failed'):
+                self.channel.queue_declare(queue=queue, durable=True)
         except Exception as e:
             print(f"Failed to connect to RabbitMQ: {e}")
     
+    def publish(self, queue, body, properties=None):
+        properties = properties or {}
+        self.channel.basic_publish(
+            exchange='',
+            routing_key=queue,
+            body=body,
+            properties=pika.BasicProperties(
+                content_type=properties.get('content_type'),
+                headers=properties.get('headers'),
+                delivery_mode=2,
+            )
+        )
+    
     def publish_order_created(self, order_data):
         try:
             if not self.channel or self.connection.is_closed:
                 self.connect()
                 
-            self.channel.basic_publish(
-                exchange='',
-                routing_key='order_created',
-                body=json.dumps(order_data)
-            )
+            with track_dependency('amqp', 'publish_order_created'):
+                publish_event(self, 'order_created', order_data, headers=message_headers())
             print(f"✅ Published order_created event for order {order_data.get('id')}")
         except Exception as e:
             print(f"❌ Failed to publish RabbitMQ event: {e}")
             # Don't re-raise the exception
     
+    async def publish_order_created_async(self, order_data):
+        """Publish without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        await loop.run_in_executor(self._executor, context.run, self.publish_order_created, order_data)
+    
+    async def queue_depth_async(self, queue):
+        return await self.depth_probe.queue_depth_async(queue)
+    
+    def _disconnect(self):
+        connection, self.connection, self.channel = self.connection, None, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
     def close(self):
         if self.connection:
-            self.connection.close()
\ No newline at end of file
+            self.connection.close()
+        self.depth_probe.close()
+
+
+class QueueDepthProbe:
+    """Passive declares on a connection of its own, reconnecting with backoff"""
+
+    MAX_BACKOFF_SECONDS = 30
+
+    def __init__(self, host='rabbitmq', port=5672):
+        self.parameters = pika.ConnectionParameters(host=host, port=port, socket_timeout=2, connection_attempts=1)
+        self.connection = None
+        self.channel = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='amqp-depth')
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def queue_depth(self, queue):
+        """Messages ready in a queue, or None if the broker can't be reached"""
+        if self.channel is None or self.connection.is_closed:
+            if time.monotonic() < self._retry_at:
+                return None
+            self._connect()
+            if self.channel is None:
+                return None
+        try:
+            with track_dependency('amqp', 'queue_depth'):
+                return self.channel.queue_declare(queue=queue, passive=True).method.message_count
+        except Exception as e:
+            print(f"Failed to read depth of {queue}: {e}")
+            self._disconnect()
+            return None
+
+    async def queue_depth_async(self, queue):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.queue_depth, queue)
+
+    def _connect(self):
+        self._disconnect()
+        try:
+            self.connection = pika.BlockingConnection(self.parameters)
+            self.channel = self.connection.channel()
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            backoff = min(self.MAX_BACKOFF_SECONDS, 2 ** self._failures)
+            self._retry_at = time.monotonic() + backoff
+            print(f"Failed to connect to RabbitMQ for queue depth, retrying in {backoff}s: {e}")
+            self._disconnect()
+
+    def _disconnect(self):
+        connection, self.connection, self.channel = self.connection, None, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def close(self):
+        self._disconnect()
\ No newline at end of file
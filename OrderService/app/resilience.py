@@ -0,0 +1,265 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+from app.metrics import registry
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
+# Used when a call is made outside any request deadline
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv('DEPENDENCY_TIMEOUT_SECONDS', '5'))
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', '0') == '1'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_SAMPLES = 20
+
+BREAKER_STATE = Gauge(
+    'circuit_breaker_state',
+    'Circuit breaker state per dependency (0 closed, 1 half open, 2 open)',
+    ['dependency'],
+    registry=registry,
+)
+BREAKER_TRIPS = Counter(
+    'circuit_breaker_trips_total',
+    'Times a dependency breaker has opened',
+    ['dependency'],
+    registry=registry,
+)
+HEDGED_REQUESTS = Counter(
+    'hedged_requests_total',
+    'Second attempts sent because the first was slower than the hedge percentile',
+    ['dependency'],
+    registry=registry,
+)
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DependencyUnavailable(Exception):
+    def __init__(self, dependency, reason, retry_after=1):
+        super().__init__(f"{dependency} unavailable: {reason}")
+        self.dependency = dependency
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@contextmanager
+def deadline(seconds):
+    """Share one time budget between every dependency call in the block"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+async def first_error(*checks):
+    """Run checks concurrently and return their results in call order.
+
+    The first check to raise cancels the others, so a fast failure (an open
+    breaker, a missing buyer) doesn't wait for the slowest dependency.
+    """
+    tasks = [asyncio.ensure_future(check) for check in checks]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in tasks:
+            if task in done and task.exception() is not None:
+                raise task.exception()
+        return [task.result() for task in tasks]
+    finally:
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        # Let them unwind (and record their timings) before the response goes out
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()  # retrieved, so a second failure isn't logged as unhandled
+
+
+def remaining_budget():
+    expires = _deadline.get()
+    if expires is None:
+        return DEFAULT_TIMEOUT_SECONDS
+    return expires - time.monotonic()
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def _set_state(self, state):
+        self.state = state
+        BREAKER_STATE.labels(self.name).set(self._STATE_VALUES[state])
+
+    def allow(self):
+        """True if a call may go out. Half open lets a single probe through"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(self.HALF_OPEN)
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def release(self):
+        """Give back a half open probe slot without judging the dependency"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        if self.state != self.OPEN:
+            self.trips += 1
+            BREAKER_TRIPS.labels(self.name).inc()
+        self.opened_at = time.monotonic()
+        self._set_state(self.OPEN)
+
+    def retry_after(self):
+        if self.state != self.OPEN:
+            return 1
+        return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "consecutiveFailures": self.failures,
+            "trips": self.trips,
+            "retryAfter": self.retry_after() if self.state == self.OPEN else 0,
+        }
+
+
+class LatencyWindow:
+    """Recent successful latencies, used to pick the hedge delay"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class Dependency:
+    """An HTTP dependency guarded by a circuit breaker and the request deadline"""
+
+    def __init__(self, name, base_url, client, hedge=HEDGE_REQUESTS, cache=None):
+        self.name = name
+        self.base_url = base_url
+        self._client = client
+        self.hedge = hedge
+        # Optional app.http_cache.ResponseCache; GETs are then revalidated by ETag
+        self.cache = cache
+        self.breaker = CircuitBreaker(name)
+        self.latencies = LatencyWindow()
+
+    async def get(self, path, headers=None):
+        """Idempotent GET, optionally hedged"""
+        if self.cache is None:
+            return await self._call('GET', path, headers, hedge=self.hedge)
+        cached, headers, entry = self.cache.before(path, headers)
+        if cached is not None:
+            return cached
+        response = await self._call('GET', path, headers, hedge=self.hedge)
+        return self.cache.after(path, response, entry)
+
+    async def post(self, path, headers=None):
+        return await self._call('POST', path, headers, hedge=False)
+
+    async def _call(self, method, path, headers, hedge):
+        if not self.breaker.allow():
+            raise DependencyUnavailable(self.name, "circuit open", self.breaker.retry_after())
+        budget = remaining_budget()
+        if budget <= 0:
+            # Out of time before asking; not the dependency's fault
+            self.breaker.release()
+            raise DependencyUnavailable(self.name, "deadline exceeded")
+
+        start = time.perf_counter()
+        try:
+            if hedge and self.breaker.state == CircuitBreaker.CLOSED:
+                attempt = self._hedged_get(path, headers, budget)
+            else:
+                attempt = self._send(method, path, headers, budget)
+            response = await asyncio.wait_for(attempt, timeout=budget)
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure()
+            raise DependencyUnavailable(self.name, str(e) or type(e).__name__, self.breaker.retry_after())
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise DependencyUnavailable(self.name, f"status {response.status_code}", self.breaker.retry_after())
+        self.breaker.record_success()
+        self.latencies.add(time.perf_counter() - start)
+        return response
+
+    def _send(self, method, path, headers, timeout):
+        return self._client().request(method, f"{self.base_url}{path}", headers=headers, timeout=timeout)
+
+    async def _hedged_get(self, path, headers, budget):
+        delay = self.latencies.percentile(HEDGE_PERCENTILE)
+        first = asyncio.ensure_future(self._send('GET', path, headers, budget))
+        attempts = [first]
+        try:
+            if delay is None or delay >= budget:
+                return await first
+
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+
+            HEDGED_REQUESTS.labels(self.name).inc()
+            attempts.append(asyncio.ensure_future(self._send('GET', path, headers, budget - delay)))
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also when the caller is cancelled (deadline, client gone) mid-wait
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
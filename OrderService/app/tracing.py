@@ -0,0 +1,192 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+CORRELATION_HEADER = 'X-Correlation-ID'
+# AMQP header names
+CORRELATION_PROPERTY = 'x-correlation-id'
+PUBLISHED_AT_PROPERTY = 'x-published-at'
+
+UNTRACED_PATHS = ('/health', '/metrics')
+
+# Spans are only written when TRACE_FILE is set
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+# Share of correlation ids whose spans are kept, decided from the id itself so
+# every service keeps or drops the same traces
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+# The file is rotated at this size, keeping TRACE_BACKUPS old files
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', str(100 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv('TRACE_BACKUPS', '3'))
+# Spans waiting for the writer thread; more are dropped
+TRACE_QUEUE_SIZE = 10000
+
+_correlation_id = contextvars.ContextVar('correlation_id', default=None)
+_service = os.getenv('SERVICE_NAME', 'unknown')
+_logger = None
+_logger_lock = threading.Lock()
+
+
+def init_tracing(service):
+    global _service
+    _service = os.getenv('SERVICE_NAME', service)
+
+
+def current_correlation_id():
+    return _correlation_id.get()
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex
+
+
+def sampled(cid):
+    if TRACE_SAMPLE_RATE >= 1:
+        return True
+    try:
+        return int(cid[:8], 16) < TRACE_SAMPLE_RATE * 0x100000000
+    except ValueError:
+        return False
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Drop spans instead of blocking or raising when the writer falls behind"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _span_logger():
+    """Logger whose records are written to TRACE_FILE by a background thread"""
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            directory = os.path.dirname(TRACE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            spans = queue.Queue(TRACE_QUEUE_SIZE)
+            file_handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS)
+            listener = QueueListener(spans, file_handler)
+            listener.start()
+            atexit.register(listener.stop)
+            logger = logging.getLogger(f'tracing.{id(spans)}')
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(_DroppingQueueHandler(spans))
+            _logger = logger
+        return _logger
+
+
+def _write(record):
+    if not TRACE_FILE:
+        return
+    _span_logger().info(json.dumps(record, separators=(',', ':')))
+
+
+def record_span(name, kind, start, end, **attrs):
+    cid = current_correlation_id()
+    if cid is None or not TRACE_FILE or not sampled(cid):
+        return
+    _write({
+        'cid': cid,
+        'service': _service,
+        'name': name,
+        'kind': kind,
+        'start': start,
+        'end': end,
+        'attrs': attrs,
+    })
+
+
+@contextmanager
+def span(name, kind='internal', **attrs):
+    start = time.time()
+    try:
+        yield
+    except Exception as e:
+        attrs['error'] = str(e)
+        raise
+    finally:
+        record_span(name, kind, start, time.time(), **attrs)
+
+
+@contextmanager
+def correlation(cid):
+    token = _correlation_id.set(cid or new_correlation_id())
+    try:
+        yield _correlation_id.get()
+    finally:
+        _correlation_id.reset(token)
+
+
+def outbound_headers(headers=None):
+    """HTTP headers carrying the current correlation id"""
+    headers = dict(headers or {})
+    cid = current_correlation_id()
+    if cid:
+        headers[CORRELATION_HEADER] = cid
+    return headers
+
+
+def message_headers(headers=None):
+    """AMQP headers carrying the current correlation id and publish time"""
+    headers = dict(headers or {})
+    cid = current_correlation_id()
+    if cid:
+        headers[CORRELATION_PROPERTY] = cid
+    headers[PUBLISHED_AT_PROPERTY] = time.time()
+    return headers
+
+
+@contextmanager
+def consumer_span(queue, properties):
+    """Adopt the message's correlation id and record queue wait + processing"""
+    headers = (properties or {}).get('headers') or {}
+    with correlation(headers.get(CORRELATION_PROPERTY)):
+        received = time.time()
+        published_at = headers.get(PUBLISHED_AT_PROPERTY)
+        if published_at:
+            record_span(f'queue {queue}', 'queue', float(published_at), received)
+        with span(f'consume {queue}', 'consume'):
+            yield
+
+
+def _route_path(app, scope):
+    from starlette.routing import Match
+    for route in app.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.path
+    return scope['path']
+
+
+def trace_requests(app):
+    """Accept or create a correlation id per request and record a server span"""
+    from fastapi import Request
+
+    @app.middleware("http")
+    async def propagate_correlation_id(request: Request, call_next):
+        if request.url.path in UNTRACED_PATHS:
+            return await call_next(request)
+        with correlation(request.headers.get(CORRELATION_HEADER)) as cid:
+            start = time.time()
+            status = 500
+            try:
+                response = await call_next(request)
+                status = response.status_code
+                response.headers[CORRELATION_HEADER] = cid
+                return response
+            finally:
+                record_span(
+                    f'{request.method} {_route_path(app, request.scope)}', 'http', start, time.time(),
+                    path=request.url.path, status=status
+                )
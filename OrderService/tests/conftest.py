@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules import each other as app.<module>, as under uvicorn
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.admission import QueueDepthMonitor
+
+
+class FakeClient:
+    def __init__(self, depths):
+        self.depths = list(depths)
+        self.monitor = None
+        self.seen = []  # monitor.depth when each read starts
+
+    async def queue_depth_async(self, queue):
+        if self.monitor is not None:
+            self.seen.append(self.monitor.depth)
+        depth = self.depths.pop(0) if self.depths else None
+        if isinstance(depth, Exception):
+            raise depth
+        return depth
+
+
+def test_sheds_orders_above_the_limit():
+    monitor = QueueDepthMonitor(FakeClient([50]), 'order_created', limit=10, interval=1)
+    asyncio.run(monitor.refresh())
+    with pytest.raises(HTTPException) as e:
+        monitor.check()
+    assert e.value.status_code == 429
+
+
+def test_failed_read_keeps_polling_and_forgets_the_depth():
+    client = FakeClient([50, RuntimeError('broker gone'), 5])
+    monitor = client.monitor = QueueDepthMonitor(client, 'order_created', limit=10, interval=0.001)
+
+    async def poll_three_times():
+        monitor.start()
+        while len(client.seen) < 4:
+            await asyncio.sleep(0.001)
+        await monitor.stop()
+
+    asyncio.run(poll_three_times())
+    assert client.seen[:4] == [None, 50, None, 5]
+
+
+def test_stale_depth_lets_orders_through():
+    monitor = QueueDepthMonitor(FakeClient([50]), 'order_created', limit=10, interval=0.01)
+    asyncio.run(monitor.refresh())
+    monitor._last = (monitor._last[0] - 1, monitor._last[1])
+    monitor.check()
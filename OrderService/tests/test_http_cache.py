@@ -0,0 +1,48 @@
+import httpx
+
+from app.http_cache import ResponseCache
+
+
+def response(status_code, etag=None, cache_control='no-cache', body=None):
+    headers = {'Cache-Control': cache_control}
+    if etag:
+        headers['ETag'] = etag
+    return httpx.Response(status_code, headers=headers, json=body)
+
+
+def test_revalidated_304_returns_the_cached_response():
+    cache = ResponseCache()
+    first = cache.after('/buyers/1', response(200, '"1.1"', body={'id': 1}))
+
+    fresh, headers, entry = cache.before('/buyers/1')
+    assert fresh is None
+    assert headers == {'If-None-Match': '"1.1"'}
+    assert cache.after('/buyers/1', response(304, '"1.1"'), entry) is first
+
+
+def test_fresh_response_is_served_without_a_request():
+    cache = ResponseCache()
+    first = cache.after('/buyers/1', response(200, '"1.1"', 'max-age=60'))
+    assert cache.before('/buyers/1') == (first, None, None)
+
+
+def test_304_for_an_evicted_entry_still_returns_the_validated_response():
+    cache = ResponseCache(size=1)
+    first = cache.after('/buyers/1', response(200, '"1.1"'))
+    _, _, entry = cache.before('/buyers/1')
+    cache.after('/buyers/2', response(200, '"2.1"'))
+
+    assert cache.after('/buyers/1', response(304), entry) is first
+
+
+def test_304_without_an_entry_is_passed_through():
+    cache = ResponseCache()
+    not_modified = response(304)
+    assert cache.after('/buyers/1', not_modified) is not_modified
+
+
+def test_response_without_etag_is_forgotten():
+    cache = ResponseCache()
+    cache.after('/buyers/1', response(200, '"1.1"'))
+    cache.after('/buyers/1', response(200))
+    assert cache.before('/buyers/1') == (None, None, None)
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.db import Database
+from app.idempotency import CREATE_INDEX, CREATE_TABLE, IdempotencyStore
+
+
+def with_store(tmp_path, test, wait=1):
+    async def run():
+        db = Database(str(tmp_path / 'orders.db'))
+        await db.execute(CREATE_TABLE)
+        await db.execute(CREATE_INDEX)
+        try:
+            return await test(IdempotencyStore(db, wait=wait))
+        finally:
+            await db.close()
+    return asyncio.run(run())
+
+
+def test_retry_gets_the_stored_response(tmp_path):
+    async def test(store):
+        assert await store.claim('k', 'f') is None
+        await store.complete('k', 201, {'id': 7})
+        return await store.claim('k', 'f')
+
+    assert with_store(tmp_path, test) == (201, {'id': 7})
+
+
+def test_key_reused_for_a_different_request(tmp_path):
+    async def test(store):
+        await store.claim('k', 'f')
+        await store.complete('k', 201, {'id': 7})
+        await store.claim('k', 'other')
+
+    with pytest.raises(HTTPException) as e:
+        with_store(tmp_path, test)
+    assert e.value.status_code == 422
+
+
+def test_concurrent_duplicate_waits_for_the_first(tmp_path):
+    async def test(store):
+        assert await store.claim('k', 'f') is None
+        duplicate = asyncio.ensure_future(store.claim('k', 'f'))
+        await asyncio.sleep(0.01)
+        assert not duplicate.done()
+        await store.complete('k', 400, {'detail': 'Buyer does not exist'})
+        return await duplicate
+
+    assert with_store(tmp_path, test) == (400, {'detail': 'Buyer does not exist'})
+
+
+def test_released_key_can_be_claimed_again(tmp_path):
+    async def test(store):
+        await store.claim('k', 'f')
+        duplicate = asyncio.ensure_future(store.claim('k', 'f'))
+        await asyncio.sleep(0.01)
+        await store.release('k')
+        # The waiting duplicate now owns the key
+        return await duplicate
+
+    assert with_store(tmp_path, test) is None
+
+
+def test_duplicate_gives_up_with_409(tmp_path):
+    async def test(store):
+        await store.claim('k', 'f')
+        await store.claim('k', 'f')
+
+    with pytest.raises(HTTPException) as e:
+        with_store(tmp_path, test, wait=0.05)
+    assert e.value.status_code == 409
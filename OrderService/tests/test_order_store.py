@@ -0,0 +1,108 @@
+import asyncio
+import sqlite3
+
+from app import order_store
+from app.db import Database
+from app.order_store import OrderStore
+
+ORDER = (1, 7, 3, '4111111111111111', 12, 2030, 123, 0.0)
+
+
+def open_store(path):
+    store = OrderStore(Database(path))
+    conn = sqlite3.connect(path)
+    store.init_db(conn)
+    conn.commit()
+    conn.close()
+    return store
+
+
+def test_ids_continue_across_monthly_partitions(tmp_path, monkeypatch):
+    path = str(tmp_path / 'orders.db')
+    store = open_store(path)
+
+    async def run():
+        monkeypatch.setattr(order_store, 'month_key', lambda: '202609')
+        first = await store.insert(ORDER)
+        monkeypatch.setattr(order_store, 'month_key', lambda: '202610')
+        second = await store.insert(ORDER)
+        found = await store.get(first), await store.get(second)
+        await store.db.close()
+        return first, second, found
+
+    first, second, (old, new) = asyncio.run(run())
+    assert (first, second) == (1, 2)
+    assert [p.name for p in store.partitions] == ['orders_202609', 'orders_202610']
+    assert old['id'] == 1 and new['id'] == 2
+
+
+def test_worker_finds_orders_in_a_partition_another_worker_started(tmp_path, monkeypatch):
+    path = str(tmp_path / 'orders.db')
+    writer, reader = open_store(path), open_store(path)
+
+    async def run():
+        monkeypatch.setattr(order_store, 'month_key', lambda: '202609')
+        await writer.insert(ORDER)
+        await reader.refresh()
+        monkeypatch.setattr(order_store, 'month_key', lambda: '202610')
+        order_id = await writer.insert(ORDER)
+        found = await reader.get(order_id)
+        page, _, _ = await reader.list(merchant_id=7)
+        missing = await reader.get(order_id + 1)
+        await writer.db.close()
+        await reader.db.close()
+        return order_id, found, page, missing
+
+    order_id, found, page, missing = asyncio.run(run())
+    assert found['id'] == order_id
+    assert [order['id'] for order in page] == [order_id, order_id - 1]
+    assert missing is None
+
+
+# orders as created before partitioning
+BASELINE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        productId INTEGER NOT NULL,
+        merchantId INTEGER NOT NULL,
+        buyerId INTEGER NOT NULL,
+        cardNumber TEXT NOT NULL,
+        expirationMonth INTEGER NOT NULL,
+        expirationYear INTEGER NOT NULL,
+        cvc INTEGER NOT NULL,
+        discount REAL DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def test_upgrade_from_baseline_database(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.executemany(
+        'INSERT INTO orders (productId, merchantId, buyerId, cardNumber, expirationMonth, expirationYear, cvc, '
+        'created_at) VALUES (1, 7, 3, ?, 12, 2030, 123, ?)',
+        [('4111111111111111', '2024-01-15 10:00:00'), ('4111111111111111', '2024-02-01 09:30:00')]
+    )
+    conn.commit()
+    conn.close()
+    store = open_store(path)
+    store.archive_dir = str(tmp_path / 'archive')
+
+    async def run():
+        order_id = await store.insert(ORDER)
+        before = await store.get(1)
+        archived = await store.archive(path)
+        after = await store.get(2)
+        page, _, archived_listing = await store.list(merchant_id=7, start='2024-01-01 00:00:00')
+        await store.db.close()
+        return order_id, before, archived, after, page, archived_listing
+
+    order_id, before, archived, after, page, archived_listing = asyncio.run(run())
+    assert order_id == 3
+    assert before['created_at'] == '2024-01-15 10:00:00'
+    assert archived == ['orders']
+    assert after['id'] == 2 and after['created_at'] == '2024-02-01 09:30:00'
+    assert [order['id'] for order in page] == [3]
+    assert [a['partition'] for a in archived_listing] == ['orders']
@@ -0,0 +1,24 @@
+import pika
+
+from app import rabbitmq_client
+from app.rabbitmq_client import QueueDepthProbe, RabbitMQClient
+
+
+def test_depth_probe_backs_off_while_the_broker_is_down(monkeypatch):
+    attempts = []
+
+    def refuse(parameters):
+        attempts.append(parameters)
+        raise pika.exceptions.AMQPConnectionError('refused')
+
+    monkeypatch.setattr(rabbitmq_client.pika, 'BlockingConnection', refuse)
+    probe = QueueDepthProbe()
+
+    assert probe.queue_depth('order_created') is None
+    assert probe.queue_depth('order_created') is None
+    assert len(attempts) == 1
+
+
+def test_depth_probe_does_not_share_the_publish_thread():
+    client = RabbitMQClient()
+    assert client.depth_probe._executor is not client._executor
@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.resilience import (
+    HEDGE_MIN_SAMPLES, CircuitBreaker, Dependency, DependencyUnavailable, deadline, first_error,
+)
+
+
+async def passes(value, delay=0):
+    await asyncio.sleep(delay)
+    return value
+
+
+async def fails(delay=0):
+    await asyncio.sleep(delay)
+    raise ValueError('missing')
+
+
+def test_first_error_returns_results_in_call_order():
+    assert asyncio.run(first_error(passes('a', 0.02), passes('b'), passes('c', 0.01))) == ['a', 'b', 'c']
+
+
+def test_first_error_does_not_wait_for_slow_checks():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    start = time.monotonic()
+    with pytest.raises(ValueError):
+        asyncio.run(first_error(slow(), fails(0.01)))
+    assert time.monotonic() - start < 1
+    assert cancelled == [True]
+
+
+def test_first_error_raises_the_earliest_failure():
+    async def late():
+        await asyncio.sleep(0.05)
+        raise KeyError('late')
+
+    with pytest.raises(ValueError):
+        asyncio.run(first_error(late(), fails(0.01)))
+
+
+class SlowClient:
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def request(self, method, url, headers=None, timeout=None):
+        self.started += 1
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+@pytest.mark.parametrize('hedge_delay, attempts', [(0.2, 1), (0.01, 2)])
+def test_cancelled_hedged_get_cancels_every_attempt(hedge_delay, attempts):
+    client = SlowClient()
+    dependency = Dependency('slow-service', 'http://slow', lambda: client, hedge=True)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        dependency.latencies.add(hedge_delay)
+
+    async def cancel_call():
+        call = asyncio.ensure_future(dependency._hedged_get('/x', None, 5))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0.01)
+        # Checked before asyncio.run() cancels whatever is left over
+        assert client.started == attempts
+        assert client.cancelled == attempts
+
+    asyncio.run(cancel_call())
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test-breaker', failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() > 1
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker('test-probe', failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class StatusClient:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.calls = 0
+
+    async def request(self, method, url, headers=None, timeout=None):
+        self.calls += 1
+        return httpx.Response(self.status_code, request=httpx.Request(method, url))
+
+
+def test_open_breaker_fails_fast_with_503():
+    client = StatusClient(500)
+    dependency = Dependency('flaky-service', 'http://flaky', lambda: client)
+    dependency.breaker.failure_threshold = 2
+
+    async def call_three_times():
+        errors = []
+        for _ in range(3):
+            with pytest.raises(DependencyUnavailable) as e:
+                await dependency.get('/x')
+            errors.append(e.value.reason)
+        return errors
+
+    assert asyncio.run(call_three_times()) == ['status 500', 'status 500', 'circuit open']
+    assert client.calls == 2
+
+
+def test_spent_deadline_is_not_held_against_the_dependency():
+    client = StatusClient(200)
+    dependency = Dependency('slow-budget', 'http://slow', lambda: client)
+
+    async def call():
+        with deadline(0):
+            await dependency.get('/x')
+
+    with pytest.raises(DependencyUnavailable, match='deadline exceeded'):
+        asyncio.run(call())
+    assert client.calls == 0
+    assert dependency.breaker.failures == 0
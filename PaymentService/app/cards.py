@@ -0,0 +1,53 @@
+from datetime import date
+from typing import List, Optional, Tuple
+
+# Luhn over ASCII digits without building per-digit lists: bytes.translate
+# maps each digit to its value (or to the digit sum of twice its value) and
+# sum() adds the resulting bytes, both in C.
+DIGITS = b'0123456789'
+PLAIN = bytes.maketrans(DIGITS, bytes(range(10)))
+DOUBLED = bytes.maketrans(DIGITS, bytes((2 * d) // 10 + (2 * d) % 10 for d in range(10)))
+
+VALID = (True, "Validation successful")
+
+
+def luhn_valid(card_number: str) -> bool:
+    number = card_number.encode('ascii', 'replace')
+    if not number.isdigit():
+        return False
+    return (sum(number[-1::-2].translate(PLAIN)) + sum(number[-2::-2].translate(DOUBLED))) % 10 == 0
+
+
+def validate_card(credit_card: dict, today: Optional[date] = None) -> Tuple[bool, str]:
+    """(valid, reason) for one card; the card expires after its expiration month"""
+    today = today or date.today()
+    return _validate(credit_card, today.year * 12 + today.month)
+
+
+def validate_cards(credit_cards: List[dict], today: Optional[date] = None) -> List[Tuple[bool, str]]:
+    """(valid, reason) for each card, in order"""
+    today = today or date.today()
+    current_month = today.year * 12 + today.month
+    return [_validate(card, current_month) for card in credit_cards]
+
+
+def _validate(credit_card, current_month):
+    if not luhn_valid(str(credit_card.get('cardNumber', ''))):
+        return False, "Invalid card number"
+
+    month = credit_card.get('expirationMonth')
+    if not isinstance(month, int) or not 1 <= month <= 12:
+        return False, "Invalid expiration month"
+
+    year = credit_card.get('expirationYear')
+    if not isinstance(year, int) or not 1000 <= year <= 9999:
+        return False, "Invalid expiration year"
+
+    if year * 12 + month < current_month:
+        return False, "Card expired"
+
+    cvc = str(credit_card.get('cvc'))
+    if len(cvc) != 3 or not cvc.isdigit():
+        return False, "Invalid CVC"
+
+    return VALID
@@ -0,0 +1,83 @@
+import os
+import time
+
+# Attempts per message including the first; the last failure goes to the dead-letter queue
+MAX_ATTEMPTS = int(os.getenv('CONSUMER_MAX_ATTEMPTS', '5'))
+# Delay before retry n is RETRY_BASE_SECONDS * 2 ** (n - 1)
+RETRY_BASE_SECONDS = float(os.getenv('CONSUMER_RETRY_BASE_SECONDS', '1'))
+
+ATTEMPTS_HEADER = 'x-attempts'
+ERROR_HEADER = 'x-last-error'
+ORIGINAL_QUEUE_HEADER = 'x-original-queue'
+FAILED_AT_HEADER = 'x-failed-at'
+
+
+class PermanentError(Exception):
+    """A message that will never succeed, e.g. one that cannot be decoded. Dead-lettered at once"""
+
+
+def retry_queue(queue, attempt):
+    return f"{queue}.retry.{attempt}"
+
+
+def dead_letter_queue(queue):
+    return f"{queue}.dlq"
+
+
+def retry_delay(attempt, base=RETRY_BASE_SECONDS):
+    return base * 2 ** (attempt - 1)
+
+
+class Consumer:
+    """Runs a handler for each message with delayed retries and a dead-letter queue.
+
+    Each queue gets retry queues <queue>.retry.<n> whose TTL hands the message
+    back to <queue>, and a <queue>.dlq for messages that failed MAX_ATTEMPTS
+    times. The handler is called as handler(queue, body, properties); if it
+    raises, the message is moved on and the original is acked, so a poison
+    message never blocks the queue.
+    """
+
+    def __init__(self, transport, handler, max_attempts=MAX_ATTEMPTS, retry_base=RETRY_BASE_SECONDS):
+        self.transport = transport
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+
+    def declare(self, queues):
+        for queue in queues:
+            self.transport.declare_queue(queue)
+            for attempt in range(1, self.max_attempts):
+                self.transport.declare_queue(retry_queue(queue, attempt), arguments={
+                    'x-message-ttl': int(retry_delay(attempt, self.retry_base) * 1000),
+                    'x-dead-letter-exchange': '',
+                    'x-dead-letter-routing-key': queue,
+                })
+            self.transport.declare_queue(dead_letter_queue(queue))
+
+    def consume(self, queues):
+        self.declare(queues)
+        self.transport.consume(queues, self.on_message)
+
+    def on_message(self, queue, body, properties):
+        try:
+            self.handler(queue, body, properties)
+        except Exception as e:
+            self.fail(queue, body, properties, e)
+
+    def fail(self, queue, body, properties, error):
+        headers = dict(properties.get('headers') or {})
+        attempts = int(headers.get(ATTEMPTS_HEADER, 0)) + 1
+        headers[ATTEMPTS_HEADER] = attempts
+        headers[ERROR_HEADER] = f"{type(error).__name__}: {error}"[:500]
+        properties = dict(properties, headers=headers)
+
+        if attempts >= self.max_attempts or isinstance(error, PermanentError):
+            headers[ORIGINAL_QUEUE_HEADER] = queue
+            headers[FAILED_AT_HEADER] = int(time.time())
+            self.transport.publish(dead_letter_queue(queue), body, properties)
+            print(f"Dead-lettered message from {queue} after {attempts} attempt(s): {error}")
+        else:
+            self.transport.publish(retry_queue(queue, attempts), body, properties)
+            print(f"Retrying message from {queue} in {retry_delay(attempts, self.retry_base):g}s "
+                  f"(attempt {attempts}/{self.max_attempts}): {error}")
@@ -1,76 +1,51 @@
-import pika
-import json
 import sqlite3
-import os
 import time
 from models import OrderEvent
+from cards import validate_card
+from consumer import Consumer, PermanentError
+from transport import create_transport, TransportConnectionError
+from events import decode_event, publish_event, queues_for
+from debug import start_debug_server
+from metrics import slow_log, start_metrics_server, track_dependency, track_message
+from payment_store import PaymentPartitions, start_archiver
+from tracing import consumer_span, init_tracing, message_headers
+
+init_tracing('payment-service')
+
+# Broker used both for consuming and for publishing payment results
+transport = None
+
+def get_transport():
+    global transport
+    if transport is None:
+        transport = create_transport()
+    return transport
+
+DB_PATH = 'payments.db'
+# Payments live in monthly partitions, see payment_store.py
+payments = PaymentPartitions()
 
 # db setup
 def init_db():
-    conn = sqlite3.connect('payments.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            orderId INTEGER NOT NULL,
-            success BOOLEAN NOT NULL,
-            reason TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    conn = sqlite3.connect(DB_PATH)
+    payments.init_db(conn)
     conn.commit()
     conn.close()
 
 init_db()
 
-def luhn_check(card_number: str) -> bool:
-    def digits_of(n):
-        return [int(d) for d in str(n)]
-    
-    digits = digits_of(card_number)
-    odd_digits = digits[-1::-2]
-    even_digits = digits[-2::-2]
-    
-    checksum = sum(odd_digits)
-    
-    for d in even_digits:
-        checksum += sum(digits_of(d * 2))
-    
-    return checksum % 10 == 0
-
 def validate_credit_card(credit_card: dict) -> tuple[bool, str]:
-    card_number = str(credit_card.get('cardNumber', ''))
-    
-    # Luhn check
-    if not luhn_check(card_number):
-        return False, "Invalid card number"
-    
-    # Month validation
-    month = credit_card.get('expirationMonth')
-    if not (1 <= month <= 12):
-        return False, "Invalid expiration month"
-    
-    # Year validation 
-    year = credit_card.get('expirationYear')
-    if not (1000 <= year <= 9999):
-        return False, "Invalid expiration year"
-    
-    # CVC validation 
-    cvc = str(credit_card.get('cvc'))
-    if len(cvc) != 3 or not cvc.isdigit():
-        return False, "Invalid CVC"
-    
-    return True, "Validation successful"
+    # Luhn, expiry against today and CVC, see cards.py
+    return validate_card(credit_card)
 
 def store_payment_result(order_id: int, success: bool, reason: str):
-    conn = sqlite3.connect('payments.db')
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO payments (orderId, success, reason) VALUES (?, ?, ?)',
-        (order_id, success, reason)
-    )
-    conn.commit()
-    conn.close()
+    """Returns the stored result, which is the earlier one if the order was already paid"""
+    with track_dependency('sqlite', 'insert_payment'):
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            return payments.record(conn, order_id, success, reason)
+        finally:
+            conn.close()
 
 def process_order_event(event_data: dict):
     order_id = event_data.get('id')
@@ -81,72 +56,47 @@ def process_order_event(event_data: dict):
     # Validatar credit card
     is_valid, reason = validate_credit_card(credit_card)
     
-    # Store result
-    store_payment_result(order_id, is_valid, reason)
+    # Store result. A redelivered order (retry after a failed publish, lost
+    # ack) keeps its first result, which is published again
+    is_valid, reason = store_payment_result(order_id, is_valid, reason)
     
-    # Send appropriate event
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=os.getenv('RABBITMQ_URL', 'rabbitmq'),
-            port=5672
-        )
-    )
-    channel = connection.channel()
+    # Send appropriate event on the consumer's own connection
+    event_type = 'payment_success' if is_valid else 'payment_failed'
+    with track_dependency('amqp', f'publish_{event_type}'):
+        publish_event(get_transport(), event_type, event_data, headers=message_headers())
     
     if is_valid:
-        channel.basic_publish(
-            exchange='',
-            routing_key='payment_success',
-            body=json.dumps(event_data)
-        )
         print(f"Payment SUCCESS for order {order_id}")
     else:
-        channel.basic_publish(
-            exchange='',
-            routing_key='payment_failed', 
-            body=json.dumps(event_data)
-        )
         print(f"Payment FAILED for order {order_id}: {reason}")
-    
-    connection.close()
 
 def start_consuming():
+    global transport
     print("Starting PaymentService...")
     
     while True:
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=os.getenv('RABBITMQ_URL', 'rabbitmq'),
-                    port=5672
-                )
-            )
-            channel = connection.channel()
+            transport = create_transport()
             
             # Declare queue
-            channel.queue_declare(queue='order_created')
-            channel.queue_declare(queue='payment_success')
-            channel.queue_declare(queue='payment_failed')
+            for queue in queues_for('payment_success') + queues_for('payment_failed'):
+                transport.declare_queue(queue)
             
             print("Connected to RabbitMQ. Waiting for order events...")
             
-            def callback(ch, method, properties, body):
-                try:
-                    event_data = json.loads(body)
+            # Errors go to the retry/dead-letter queues, see consumer.py
+            def callback(queue, body, properties):
+                with track_message(queue), consumer_span(queue, properties):
+                    try:
+                        event_data = decode_event(body, properties)
+                    except ValueError as e:
+                        raise PermanentError(str(e)) from e
                     print(f"Received order_created event for order {event_data.get('id')}")
                     process_order_event(event_data)
-                except Exception as e:
-                    print(f"Error processing order event: {e}")
-            
-            channel.basic_consume(
-                queue='order_created',
-                on_message_callback=callback,
-                auto_ack=True
-            )
             
-            channel.start_consuming()
+            Consumer(transport, callback).consume(['order_created'])
             
-        except pika.exceptions.AMQPConnectionError:
+        except TransportConnectionError:
             print("Cannot connect to RabbitMQ. Retrying in 5 seconds...")
             time.sleep(5)
         except KeyboardInterrupt:
@@ -157,4 +107,7 @@ def start_consuming():
             time.sleep(5)
 
 if __name__ == "__main__":
+    start_metrics_server()
+    start_debug_server(slow_log)
+    start_archiver(DB_PATH)
     start_consuming()
@@ -0,0 +1,136 @@
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+# Partitions for this many most recent months stay in SQLite
+HOT_PARTITION_MONTHS = int(os.getenv('HOT_PARTITION_MONTHS', '3'))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+ARCHIVE_CHECK_SECONDS = float(os.getenv('ARCHIVE_CHECK_SECONDS', '3600'))
+
+# One row per partition table. Monthly tables have first_month == last_month;
+# a table that predates partitioning spans everything up to its last_month.
+CATALOG_SQL = '''
+    CREATE TABLE IF NOT EXISTS partitions (
+        name TEXT PRIMARY KEY,
+        base TEXT NOT NULL,
+        first_month TEXT NOT NULL,
+        last_month TEXT NOT NULL,
+        first_id INTEGER,
+        archive_path TEXT,
+        row_count INTEGER,
+        archived_at INTEGER
+    )
+'''
+
+
+def month_key(ts=None):
+    """YYYYMM (UTC) for an epoch time, default now"""
+    return datetime.fromtimestamp(time.time() if ts is None else ts, tz=timezone.utc).strftime('%Y%m')
+
+
+def month_of_timestamp(value):
+    """YYYYMM from an SQLite CURRENT_TIMESTAMP string"""
+    return value[:4] + value[5:7]
+
+
+def months_between(earlier, later):
+    return (int(later[:4]) - int(earlier[:4])) * 12 + int(later[4:]) - int(earlier[4:])
+
+
+def partition_name(base, month):
+    return f"{base}_{month}"
+
+
+def adopt_legacy_table(conn, base):
+    """Register a table from before partitioning as the oldest partition. True if it was adopted now"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (base,)).fetchone() is None:
+        return False
+    if conn.execute('SELECT 1 FROM partitions WHERE name = ?', (base,)).fetchone() is not None:
+        return False
+    first, last = conn.execute(f'SELECT MIN(created_at), MAX(created_at) FROM {base}').fetchone()
+    now = month_key()
+    conn.execute(
+        'INSERT INTO partitions (name, base, first_month, last_month, first_id) VALUES (?, ?, ?, ?, 1)',
+        (base, base, month_of_timestamp(first) if first else now, month_of_timestamp(last) if last else now)
+    )
+    return True
+
+
+def newest_partition(conn, base):
+    return conn.execute(
+        'SELECT name, last_month FROM partitions WHERE base = ? AND archived_at IS NULL '
+        'ORDER BY last_month DESC, first_id DESC LIMIT 1', (base,)
+    ).fetchone()
+
+
+def cold_partitions(conn, base, now_month=None, hot_months=HOT_PARTITION_MONTHS):
+    """Unarchived partitions older than the hot window. The newest partition is never cold"""
+    now_month = now_month or month_key()
+    newest = newest_partition(conn, base)
+    rows = conn.execute(
+        'SELECT name, last_month FROM partitions WHERE base = ? AND archived_at IS NULL ORDER BY last_month', (base,)
+    ).fetchall()
+    return [name for name, last_month in rows
+            if months_between(last_month, now_month) >= hot_months and (newest is None or name != newest[0])]
+
+
+def archive_partition(conn, name, archive_dir=ARCHIVE_DIR):
+    """Write a partition to <archive_dir>/<name>.ndjson.gz in id order, then drop the table"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+    tmp_path = path + '.tmp'
+    cursor = conn.execute(f'SELECT * FROM {name} ORDER BY id')
+    columns = [c[0] for c in cursor.description]
+    written = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row))) + '\n')
+            written += len(rows)
+    (expected,) = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()
+    if written != expected:
+        os.remove(tmp_path)
+        raise RuntimeError(f"Archived {written} rows of {name} but it has {expected}")
+    os.replace(tmp_path, path)
+    with conn:
+        conn.execute(
+            'UPDATE partitions SET archive_path = ?, row_count = ?, archived_at = ? WHERE name = ?',
+            (path, written, int(time.time()), name)
+        )
+        conn.execute(f'DROP TABLE {name}')
+    return path, written
+
+
+def archive_cold_partitions(db_path, base, archive_dir=ARCHIVE_DIR, hot_months=HOT_PARTITION_MONTHS):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        archived = []
+        for name in cold_partitions(conn, base, hot_months=hot_months):
+            path, rows = archive_partition(conn, name, archive_dir)
+            print(f"Archived {rows} rows from {name} to {path}")
+            archived.append(name)
+        return archived
+    finally:
+        conn.close()
+
+
+def scan_archive(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def find_in_archive(path, row_id):
+    """Archives are written in id order, so the scan stops once it passes row_id"""
+    for row in scan_archive(path):
+        if row['id'] == row_id:
+            return row
+        if row['id'] > row_id:
+            break
+    return None
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+
+from partitions import (
+    ARCHIVE_CHECK_SECONDS, ARCHIVE_DIR, CATALOG_SQL, HOT_PARTITION_MONTHS, adopt_legacy_table,
+    archive_cold_partitions, month_key, newest_partition, partition_name,
+)
+
+BASE = 'payments'
+
+PARTITION_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        orderId INTEGER NOT NULL,
+        success BOOLEAN NOT NULL,
+        reason TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # One payment per order, so a redelivered order_created is not charged twice
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_{name}_order ON {name} (orderId)',
+]
+
+# Ids continue from the partition before, so they stay unique in the archives
+INSERT_SQL = '''
+    INSERT INTO {name} (id, orderId, success, reason)
+    VALUES ((SELECT COALESCE(MAX(id), ?) + 1 FROM {name}), ?, ?, ?)
+'''
+# Only valid on tables with uq_<name>_order; the legacy table and partitions
+# that already held duplicates rely on find() under the write lock alone
+ON_CONFLICT_SQL = ' ON CONFLICT (orderId) DO NOTHING'
+
+
+class PaymentPartitions:
+    """Payments in monthly tables (payments_YYYYMM) listed in a partitions catalog.
+
+    Only the consumer thread inserts, so the current partition is cached here
+    and checked against the clock on every insert.
+    """
+
+    def __init__(self):
+        self.current = None  # (name, month, first_id)
+
+    def init_db(self, conn):
+        conn.execute(CATALOG_SQL)
+        if adopt_legacy_table(conn, BASE):
+            # May already hold duplicates, so only a plain index
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{BASE}_order ON {BASE} (orderId)')
+        for name in self._hot_partitions(conn):
+            if name == BASE:
+                continue
+            try:
+                conn.execute(PARTITION_SCHEMA[1].format(name=name))
+            except sqlite3.IntegrityError:
+                print(f"{name} has several payments for one order; not adding the unique index")
+
+    @staticmethod
+    def _hot_partitions(conn):
+        return [row[0] for row in conn.execute(
+            'SELECT name FROM partitions WHERE base = ? AND archived_at IS NULL ORDER BY first_id DESC', (BASE,)
+        )]
+
+    def _current(self, conn):
+        month = month_key()
+        if self.current is None:
+            newest = newest_partition(conn, BASE)
+            if newest is not None:
+                name, last_month = newest
+                (first_id,) = conn.execute('SELECT first_id FROM partitions WHERE name = ?', (name,)).fetchone()
+                self.current = (name, last_month, first_id)
+        if self.current is not None and self.current[1] >= month:
+            return self.current
+
+        name = partition_name(BASE, month)
+        for statement in PARTITION_SCHEMA:
+            conn.execute(statement.format(name=name))
+        first_id = 1
+        if self.current is not None:
+            (last_id,) = conn.execute(f'SELECT MAX(id) FROM {self.current[0]}').fetchone()
+            first_id = (last_id or self.current[2] - 1) + 1
+        conn.execute(
+            'INSERT OR IGNORE INTO partitions (name, base, first_month, last_month, first_id) VALUES (?, ?, ?, ?, ?)',
+            (name, BASE, month, month, first_id)
+        )
+        print(f"Started payment partition {name} at id {first_id}")
+        self.current = (name, month, first_id)
+        return self.current
+
+    @staticmethod
+    def _has_unique_index(conn, name):
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (f'uq_{name}_order',)
+        ).fetchone() is not None
+
+    def find(self, conn, order_id):
+        """(success, reason) stored for an order, newest partition first, or None"""
+        for name in self._hot_partitions(conn):
+            row = conn.execute(f'SELECT success, reason FROM {name} WHERE orderId = ? LIMIT 1', (order_id,)).fetchone()
+            if row is not None:
+                return bool(row[0]), row[1]
+        return None
+
+    def record(self, conn, order_id, success, reason):
+        """Store the result unless the order already has one; returns the stored (success, reason)"""
+        with conn:
+            # Take the write lock first so no other writer can insert between find() and the insert
+            conn.execute('BEGIN IMMEDIATE')
+            stored = self.find(conn, order_id)
+            if stored is not None:
+                return stored
+            name, _, first_id = self._current(conn)
+            sql = INSERT_SQL.format(name=name)
+            if self._has_unique_index(conn, name):
+                sql += ON_CONFLICT_SQL
+            conn.execute(sql, (first_id - 1, order_id, success, reason))
+        return success, reason
+
+
+def start_archiver(db_path, archive_dir=ARCHIVE_DIR, hot_months=HOT_PARTITION_MONTHS, interval=ARCHIVE_CHECK_SECONDS):
+    """Archive cold payment partitions every interval seconds in a daemon thread"""
+    def run():
+        while not stop.is_set():
+            try:
+                archive_cold_partitions(db_path, BASE, archive_dir, hot_months)
+            except Exception as e:
+                print(f"Archiving payments failed: {e}")
+            stop.wait(interval)
+
+    stop = threading.Event()
+    threading.Thread(target=run, name='payment-archiver', daemon=True).start()
+    return stop
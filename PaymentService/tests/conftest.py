@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service runs as `python app/main.py`, so its modules import each other flat
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
@@ -0,0 +1,30 @@
+from datetime import date
+
+from cards import luhn_valid, validate_card, validate_cards
+
+CARD = {"cardNumber": "4111111111111111", "expirationMonth": 5, "expirationYear": 2030, "cvc": 123}
+TODAY = date(2030, 5, 20)
+
+
+def test_luhn():
+    assert luhn_valid('4111111111111111')
+    assert not luhn_valid('4111111111111112')
+    assert not luhn_valid('4111-1111-1111-1111')
+    assert not luhn_valid('')
+
+
+def test_card_is_valid_through_its_expiration_month():
+    assert validate_card(CARD, TODAY) == (True, "Validation successful")
+    assert validate_card(CARD, date(2030, 6, 1)) == (False, "Card expired")
+
+
+def test_each_field_is_checked():
+    assert validate_card(dict(CARD, cardNumber="4111111111111112"), TODAY) == (False, "Invalid card number")
+    assert validate_card(dict(CARD, expirationMonth=13), TODAY) == (False, "Invalid expiration month")
+    assert validate_card(dict(CARD, expirationYear=30), TODAY) == (False, "Invalid expiration year")
+    assert validate_card(dict(CARD, cvc=12), TODAY) == (False, "Invalid CVC")
+
+
+def test_batch_matches_one_at_a_time():
+    cards = [CARD, dict(CARD, cvc='abc'), dict(CARD, expirationYear=2029)]
+    assert validate_cards(cards, TODAY) == [validate_card(card, TODAY) for card in cards]
@@ -0,0 +1,71 @@
+from consumer import (
+    ATTEMPTS_HEADER, ERROR_HEADER, ORIGINAL_QUEUE_HEADER, Consumer, PermanentError, dead_letter_queue, retry_queue,
+)
+from transport import InMemoryBroker, InMemoryTransport
+
+
+def start(handler, max_attempts=3, retry_base=0):
+    broker = InMemoryBroker()
+    consumer = Consumer(InMemoryTransport(broker), handler, max_attempts=max_attempts, retry_base=retry_base)
+    consumer.declare(['order_created'])
+    broker.subscribe('order_created', consumer.on_message)
+    return broker
+
+
+def test_handled_message_is_acked():
+    handled = []
+    broker = start(lambda queue, body, properties: handled.append(body))
+    broker.publish('order_created', b'{}', {'headers': {}})
+
+    assert broker.drain() == 1
+    assert handled == [b'{}']
+    assert broker.depth('order_created') == 0
+
+
+def test_failing_message_is_retried_then_dead_lettered():
+    attempts = []
+
+    def handler(queue, body, properties):
+        attempts.append(properties['headers'].get(ATTEMPTS_HEADER, 0))
+        raise RuntimeError('database is locked')
+
+    broker = start(handler)
+    broker.publish('order_created', b'{}', {'headers': {}})
+    # A zero retry delay expires the message back to order_created on the next drain
+    broker.drain()
+    broker.drain()
+    broker.drain()
+
+    assert attempts == [0, 1, 2]
+    assert broker.depth(retry_queue('order_created', 1)) == 0
+    dead = []
+    broker.subscribe(dead_letter_queue('order_created'), lambda queue, body, properties: dead.append(properties))
+    assert broker.drain() == 1
+    (properties,) = dead
+    assert properties['headers'][ATTEMPTS_HEADER] == 3
+    assert properties['headers'][ORIGINAL_QUEUE_HEADER] == 'order_created'
+    assert properties['headers'][ERROR_HEADER] == 'RuntimeError: database is locked'
+
+
+def test_retry_waits_for_the_delay():
+    def handler(queue, body, properties):
+        raise RuntimeError('down')
+
+    broker = start(handler, retry_base=60)
+    broker.publish('order_created', b'{}', {'headers': {}})
+
+    assert broker.drain() == 1
+    assert broker.drain() == 0
+    assert broker.depth(retry_queue('order_created', 1)) == 1
+
+
+def test_permanent_error_is_dead_lettered_at_once():
+    def handler(queue, body, properties):
+        raise PermanentError('not JSON')
+
+    broker = start(handler)
+    broker.publish('order_created', b'garbage', {'headers': {}})
+    broker.drain()
+
+    assert broker.depth(retry_queue('order_created', 1)) == 0
+    assert broker.depth(dead_letter_queue('order_created')) == 1
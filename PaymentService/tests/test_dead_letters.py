@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'tools'))
+
+import dead_letters  # noqa: E402
+
+
+class PoisonChannel:
+    """A broker where every replayed message is dead-lettered again at once"""
+
+    def __init__(self, count):
+        self.dlq = [(b'{}', SimpleNamespace(headers={'x-attempts': 5}, content_type='application/json'))] * count
+        self.published = 0
+
+    def confirm_delivery(self):
+        pass
+
+    def queue_declare(self, queue, passive):
+        return SimpleNamespace(method=SimpleNamespace(message_count=len(self.dlq)))
+
+    def basic_get(self, queue, auto_ack):
+        if not self.dlq:
+            return None, None, None
+        body, props = self.dlq.pop(0)
+        return SimpleNamespace(delivery_tag=1), props, body
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published += 1
+        self.dlq.append((body, properties))
+
+    def basic_ack(self, delivery_tag):
+        pass
+
+
+def test_replay_stops_after_the_messages_present_at_start():
+    channel = PoisonChannel(3)
+    dead_letters.cmd_replay(channel, argparse.Namespace(queue='order_created', limit=None))
+    assert channel.published == 3
+
+
+def test_replay_limit():
+    channel = PoisonChannel(3)
+    dead_letters.cmd_replay(channel, argparse.Namespace(queue='order_created', limit=2))
+    assert channel.published == 2
@@ -0,0 +1,63 @@
+import calendar
+import sqlite3
+
+from partitions import (
+    CATALOG_SQL, archive_cold_partitions, cold_partitions, find_in_archive, month_key, months_between,
+    scan_archive,
+)
+
+
+def test_month_key_is_utc():
+    assert month_key(calendar.timegm((2024, 12, 31, 23, 30, 0))) == '202412'
+    assert month_key(calendar.timegm((2025, 1, 1, 0, 0, 0))) == '202501'
+
+
+def test_months_between_crosses_years():
+    assert months_between('202411', '202502') == 3
+    assert months_between('202502', '202502') == 0
+
+
+def catalog(conn, partitions):
+    conn.execute(CATALOG_SQL)
+    for name, month, first_id in partitions:
+        conn.execute(f'CREATE TABLE {name} (id INTEGER PRIMARY KEY, orderId INTEGER)')
+        conn.execute(
+            'INSERT INTO partitions (name, base, first_month, last_month, first_id) VALUES (?, ?, ?, ?, ?)',
+            (name, 'payments', month, month, first_id)
+        )
+    conn.commit()
+
+
+def test_only_partitions_outside_the_hot_window_are_cold():
+    conn = sqlite3.connect(':memory:')
+    catalog(conn, [('payments_202401', '202401', 1), ('payments_202403', '202403', 10), ('payments_202404', '202404', 20)])
+    assert cold_partitions(conn, 'payments', now_month='202406', hot_months=3) == ['payments_202401', 'payments_202403']
+
+
+def test_newest_partition_is_never_cold():
+    conn = sqlite3.connect(':memory:')
+    catalog(conn, [('payments_202401', '202401', 1)])
+    assert cold_partitions(conn, 'payments', now_month='202406', hot_months=1) == []
+
+
+def test_archive_writes_rows_in_id_order_and_drops_the_table(tmp_path):
+    path = str(tmp_path / 'payments.db')
+    conn = sqlite3.connect(path)
+    catalog(conn, [('payments_200001', '200001', 1), ('payments_200002', '200002', 4)])
+    conn.executemany('INSERT INTO payments_200001 (id, orderId) VALUES (?, ?)', [(3, 30), (1, 10), (2, 20)])
+    conn.commit()
+    conn.close()
+
+    assert archive_cold_partitions(path, 'payments', str(tmp_path / 'archive'), hot_months=3) == ['payments_200001']
+
+    conn = sqlite3.connect(path)
+    archive_path, row_count = conn.execute(
+        "SELECT archive_path, row_count FROM partitions WHERE name = 'payments_200001'"
+    ).fetchone()
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert row_count == 3
+    assert 'payments_200001' not in tables
+    assert [row['id'] for row in scan_archive(archive_path)] == [1, 2, 3]
+    assert find_in_archive(archive_path, 2) == {'id': 2, 'orderId': 20}
+    assert find_in_archive(archive_path, 9) is None
@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from partitions import month_key, partition_name
+from payment_store import PaymentPartitions
+
+# payments as created before partitioning
+BASELINE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        orderId INTEGER NOT NULL,
+        success BOOLEAN NOT NULL,
+        reason TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'payments.db'))
+    yield conn
+    conn.close()
+
+
+def open_store(conn):
+    store = PaymentPartitions()
+    store.init_db(conn)
+    conn.commit()
+    return store
+
+
+def count(conn, table, order_id):
+    return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE orderId = ?', (order_id,)).fetchone()[0]
+
+
+def test_record_creates_monthly_partition_with_unique_order(conn):
+    store = open_store(conn)
+
+    assert store.record(conn, 1, True, 'ok') == (True, 'ok')
+
+    name = partition_name('payments', month_key())
+    assert count(conn, name, 1) == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute(f'INSERT INTO {name} (orderId, success) VALUES (1, 0)')
+
+
+def test_redelivered_order_keeps_first_result(conn):
+    store = open_store(conn)
+    store.record(conn, 1, False, 'Card expired')
+
+    assert store.record(conn, 1, True, 'ok') == (False, 'Card expired')
+    assert count(conn, partition_name('payments', month_key()), 1) == 1
+
+
+def test_upgrade_from_baseline_database(conn):
+    # One payment from this month, so the legacy table is also the newest partition
+    conn.execute(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO payments (orderId, success, reason) VALUES (1, 1, 'ok')")
+    conn.commit()
+
+    store = open_store(conn)
+
+    assert store.record(conn, 2, True, 'ok') == (True, 'ok')
+    assert store.record(conn, 2, False, 'Card expired') == (True, 'ok')
+    assert count(conn, 'payments', 2) == 1
+    assert store.record(conn, 1, False, 'Card expired') == (True, 'ok')
+
+
+def test_upgrade_keeps_working_with_duplicate_legacy_rows(conn):
+    conn.execute(BASELINE_SCHEMA)
+    conn.executemany("INSERT INTO payments (orderId, success, reason) VALUES (?, 1, 'ok')", [(1,), (1,)])
+    conn.commit()
+
+    store = open_store(conn)
+
+    assert store.record(conn, 1, False, 'Card expired') == (True, 'ok')
+    assert store.record(conn, 2, True, 'ok') == (True, 'ok')
+    assert count(conn, 'payments', 2) == 1
@@ -0,0 +1,134 @@
+"""Compare PaymentService batch card validation with the old per-card functions.
+
+The old luhn_check/validate_credit_card are reproduced below as they were
+before cards.py. Both are run over the same generated cards at each batch
+size and the results are checked to agree (the old code has no expiry check,
+so expired cards are compared as if they were valid).
+
+    python tools/card_validation_benchmark.py
+    python tools/card_validation_benchmark.py --sizes 1 100 10000 --seconds 1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'PaymentService', 'app'))
+
+from cards import VALID, luhn_valid, validate_cards  # noqa: E402
+
+
+def reference_luhn_check(card_number: str) -> bool:
+    def digits_of(n):
+        return [int(d) for d in str(n)]
+
+    digits = digits_of(card_number)
+    odd_digits = digits[-1::-2]
+    even_digits = digits[-2::-2]
+
+    checksum = sum(odd_digits)
+
+    for d in even_digits:
+        checksum += sum(digits_of(d * 2))
+
+    return checksum % 10 == 0
+
+
+def reference_validate_credit_card(credit_card: dict):
+    card_number = str(credit_card.get('cardNumber', ''))
+    if not reference_luhn_check(card_number):
+        return False, "Invalid card number"
+    month = credit_card.get('expirationMonth')
+    if not (1 <= month <= 12):
+        return False, "Invalid expiration month"
+    year = credit_card.get('expirationYear')
+    if not (1000 <= year <= 9999):
+        return False, "Invalid expiration year"
+    cvc = str(credit_card.get('cvc'))
+    if len(cvc) != 3 or not cvc.isdigit():
+        return False, "Invalid CVC"
+    return True, "Validation successful"
+
+
+def with_check_digit(body):
+    for digit in '0123456789':
+        if luhn_valid(body + digit):
+            return body + digit
+
+
+def generate_cards(count, rng):
+    """Mostly valid cards with some bad numbers, months, CVCs and expired dates"""
+    cards = []
+    for _ in range(count):
+        number = with_check_digit(''.join(rng.choice('0123456789') for _ in range(15)))
+        if rng.random() < 0.1:
+            number = number[:-1] + str((int(number[-1]) + 1) % 10)
+        cards.append({
+            "cardNumber": number,
+            "expirationMonth": rng.randint(1, 12) if rng.random() > 0.02 else 13,
+            "expirationYear": rng.randint(2020, 2035),
+            "cvc": rng.randint(100, 999) if rng.random() > 0.02 else rng.randint(10, 99),
+        })
+    return cards
+
+
+def check_agreement(cards, today):
+    new = validate_cards(cards, today)
+    for card, old, result in zip(cards, map(reference_validate_credit_card, cards), new):
+        if result == (False, "Card expired"):
+            # Past everything the old code checks except the CVC
+            cvc = str(card['cvc'])
+            result = VALID if len(cvc) == 3 and cvc.isdigit() else (False, "Invalid CVC")
+        if old != result:
+            raise SystemExit(f"Results differ for {card}: old {old}, new {result}")
+    return sum(1 for valid, _ in new if valid)
+
+
+def time_per_card(run, cards, seconds):
+    """Best mean seconds per card over repeated runs lasting about `seconds`"""
+    best = float('inf')
+    deadline = time.perf_counter() + seconds
+    while True:
+        start = time.perf_counter()
+        run(cards)
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed / len(cards))
+        if time.perf_counter() >= deadline:
+            return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--seconds', type=float, default=0.5, help='time spent per size and implementation')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    today = date.today()
+    cards = generate_cards(max(args.sizes), rng)
+    valid = check_agreement(cards, today)
+    print(f"{len(cards)} cards, {valid} valid, results agree with the old functions\n")
+
+    def old(batch):
+        return [reference_validate_credit_card(card) for card in batch]
+
+    def new(batch):
+        return validate_cards(batch, today)
+
+    print(f"{'batch':>8}{'old us/card':>14}{'new us/card':>14}{'new cards/s':>14}{'speedup':>10}")
+    for size in args.sizes:
+        batch = cards[:size]
+        old_seconds = time_per_card(old, batch, args.seconds)
+        new_seconds = time_per_card(new, batch, args.seconds)
+        print(
+            f"{size:>8}{old_seconds * 1e6:>14.2f}{new_seconds * 1e6:>14.2f}"
+            f"{1 / new_seconds:>14,.0f}{old_seconds / new_seconds:>9.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
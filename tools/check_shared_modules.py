@@ -0,0 +1,77 @@
+"""Fail when the copies of a shared module differ between services.
+
+Each service is built from its own directory, so modules used by several of
+them are copied into every app/ that needs one. Edit one copy, then copy it
+to the others and run
+
+    python tools/check_shared_modules.py
+    python tools/check_shared_modules.py --diff
+
+Exits 1 and names the modules whose copies have drifted.
+"""
+import argparse
+import difflib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ['OrderService', 'PaymentService', 'InventoryService', 'EmailService', 'BuyerService', 'MerchantService']
+
+SHARED_MODULES = [
+    'metrics.py', 'tracing.py', 'debug.py', 'consumer.py', 'events.py', 'db.py',
+    'concurrency.py', 'transport.py', 'http_cache.py', 'conditional.py', 'partitions.py',
+]
+# Copies that are meant to differ. InventoryService's transport has no
+# PikaTransport (its consumer connects through rabbitmq_client.py). leader.py
+# is not listed: each copy has its own default lock file name.
+EXEMPT = {('InventoryService', 'transport.py')}
+
+
+def copies(module):
+    """{service: path} of every copy of `module`"""
+    found = {}
+    for service in SERVICES:
+        path = os.path.join(ROOT, service, 'app', module)
+        if os.path.exists(path) and (service, module) not in EXEMPT:
+            found[service] = path
+    return found
+
+
+def read(path):
+    with open(path) as f:
+        return f.readlines()
+
+
+def check(module, show_diff=False, out=sys.stdout):
+    """True if every copy of `module` matches the first one"""
+    found = copies(module)
+    if len(found) < 2:
+        return True
+    (reference, reference_path), *others = found.items()
+    expected = read(reference_path)
+    drifted = [service for service, path in others if read(path) != expected]
+    if not drifted:
+        return True
+    print(f"{module}: {', '.join(drifted)} differ from {reference}", file=out)
+    if show_diff:
+        for service in drifted:
+            out.writelines(difflib.unified_diff(
+                expected, read(found[service]),
+                f"{reference}/app/{module}", f"{service}/app/{module}"
+            ))
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--diff', action='store_true', help='print a unified diff for each drifted copy')
+    args = parser.parse_args(argv)
+
+    results = [check(module, args.diff) for module in SHARED_MODULES]
+    if not all(results):
+        sys.exit(1)
+    print(f"{len(SHARED_MODULES)} shared modules are identical across services")
+
+
+if __name__ == '__main__':
+    main()
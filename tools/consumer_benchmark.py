@@ -0,0 +1,262 @@
+"""Replay order/payment events through the real consumers.
+
+Loads PaymentService, InventoryService, EmailService and MerchantService in
+one process and starts each one's consumer (Consumer, decoding, metrics and
+spans included) on an in-memory broker, then reports messages per second and
+timings per service and queue. No RabbitMQ is needed.
+
+    python tools/consumer_benchmark.py --orders 5000
+    python tools/consumer_benchmark.py --orders 5000 --encoding msgpack
+    python tools/consumer_benchmark.py --input events.ndjson --profile out.prof
+
+Recorded streams are NDJSON with one {"queue": ..., "body": {...}} per line.
+Events are published the way the services publish them, one projection per
+consumer queue.
+"""
+import argparse
+import contextlib
+import cProfile
+import importlib.util
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALID_CARD = {"cardNumber": "4111111111111111", "expirationMonth": 12, "expirationYear": 2030, "cvc": 123}
+INVALID_CARD = {"cardNumber": "4111111111111112", "expirationMonth": 12, "expirationYear": 2030, "cvc": 123}
+
+
+def _forget_modules(names):
+    for name in list(sys.modules):
+        if name in names or any(name.startswith(n + '.') for n in names):
+            del sys.modules[name]
+
+
+def load_script_service(service, alias):
+    """Load a service that runs as `python app/main.py` (flat imports)"""
+    app_dir = os.path.join(ROOT, service, 'app')
+    sys.path.insert(0, app_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(alias, os.path.join(app_dir, 'main.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        helpers = {name: sys.modules[name] for name in ('transport', 'events', 'consumer')}
+    finally:
+        sys.path.remove(app_dir)
+        _forget_modules({'models', 'transport', 'events', 'metrics', 'tracing', 'consumer'})
+    return module, helpers
+
+
+def load_package_service(service):
+    """Load a service that runs as `uvicorn app.main:app`"""
+    service_dir = os.path.join(ROOT, service)
+    sys.path.insert(0, service_dir)
+    try:
+        module = importlib.import_module('app.main')
+    finally:
+        sys.path.remove(service_dir)
+        _forget_modules({'app'})
+    return module
+
+
+class BenchTransport:
+    """One service's transport on the shared in-memory broker, timing each delivery"""
+
+    def __init__(self, broker, service, stats, subscribed):
+        self.broker = broker
+        self.service = service
+        self.stats = stats
+        self.subscribed = subscribed
+        self._closed = threading.Event()
+
+    def declare_queue(self, queue, arguments=None):
+        self.broker.declare_queue(queue, arguments)
+
+    def publish(self, queue, body, properties=None):
+        self.broker.publish(queue, body, properties)
+
+    def consume(self, queues, callback):
+        def timed(queue, body, properties):
+            start = time.perf_counter()
+            try:
+                callback(queue, body, properties)
+            finally:
+                self.stats.record(f"{self.service} {queue}", time.perf_counter() - start)
+
+        for queue in queues:
+            self.broker.subscribe(queue, timed)
+        self.subscribed.release()
+        # Delivery happens in the thread that calls broker.drain()
+        self._closed.wait()
+
+    def stop(self):
+        self._closed.set()
+
+    def close(self):
+        self._closed.set()
+
+
+class StageStats:
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def report(self, wall, delivered, out=sys.stdout):
+        print(f"\n{delivered} messages in {wall:.3f}s -> {delivered / wall:,.0f} msg/s\n", file=out)
+        print(f"{'stage':<36}{'msgs':>8}{'total s':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'msg/s':>10}", file=out)
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            total = sum(ordered)
+            print(
+                f"{stage:<36}{len(ordered):>8}{total:>10.3f}"
+                f"{total / len(ordered) * 1000:>10.3f}"
+                f"{percentile(ordered, 50) * 1000:>10.3f}"
+                f"{percentile(ordered, 99) * 1000:>10.3f}"
+                f"{len(ordered) / total if total else 0:>10,.0f}",
+                file=out
+            )
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def synthetic_events(count, invalid_ratio, products, seed):
+    rng = random.Random(seed)
+    for order_id in range(1, count + 1):
+        card = INVALID_CARD if rng.random() < invalid_ratio else VALID_CARD
+        yield 'order_created', {
+            "id": order_id,
+            "productId": rng.randint(1, products),
+            "merchantId": 1,
+            "buyerId": rng.randint(1, 1000),
+            "creditCard": dict(card),
+            "discount": 0.0,
+            "unitPrice": 9.99,
+            "createdAt": int(time.time())
+        }
+
+
+def recorded_events(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record['queue'], record['body']
+
+
+def seed_inventory(shards, products, stock):
+    rows_by_shard = {}
+    for i in range(1, products + 1):
+        rows_by_shard.setdefault(shards.path_for(i), []).append((i, f"Bench Product {i}", stock, stock))
+    for path, rows in rows_by_shard.items():
+        conn = sqlite3.connect(path)
+        conn.executemany(
+            'INSERT INTO products (id, merchantId, productName, price, quantity, reserved) VALUES (?, 1, ?, 9.99, ?, ?)',
+            rows
+        )
+        conn.commit()
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1000, help='synthetic order_created events to generate')
+    parser.add_argument('--invalid-ratio', type=float, default=0.1, help='share of orders with a bad card')
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--input', help='NDJSON file of recorded events to replay instead')
+    parser.add_argument('--encoding', choices=['json', 'msgpack'], default='json')
+    parser.add_argument('--shards', type=int, default=1, help='INVENTORY_SHARDS for InventoryService')
+    parser.add_argument('--lookups', action='store_true', help='let EmailService call buyer/merchant services')
+    parser.add_argument('--profile', help='write cProfile stats for the run to this file')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='consumer-bench-')
+    os.chdir(workdir)
+    os.environ['MESSAGE_TRANSPORT'] = 'memory'
+    os.environ['EVENT_ENCODING'] = args.encoding
+    os.environ['INVENTORY_SHARDS'] = str(args.shards)
+
+    inventory = load_package_service('InventoryService')
+    inventory.init_db()
+    payment, helpers = load_script_service('PaymentService', 'payment_service_main')
+    transport_module, events = helpers['transport'], helpers['events']
+    if args.encoding == 'msgpack' and events.default_content_type() != events.MSGPACK:
+        parser.exit(1, "msgpack is not installed\n")
+    email, _ = load_script_service('EmailService', 'email_service_main')
+    merchant = load_package_service('MerchantService')
+
+    if not args.lookups:
+        email.get_buyer_email = lambda buyer_id: f"buyer{buyer_id}@example.com"
+        email.get_merchant_email = lambda merchant_id: f"merchant{merchant_id}@example.com"
+
+    stream = list(recorded_events(args.input) if args.input else
+                  synthetic_events(args.orders, args.invalid_ratio, args.products, args.seed))
+    seed_inventory(inventory.shards, args.products, len(stream) + 1)
+
+    broker = transport_module.InMemoryBroker()
+    stats = StageStats()
+    subscribed = threading.Semaphore(0)
+
+    def bench_transport(service):
+        return BenchTransport(broker, service, stats, subscribed)
+
+    # Each service's own consumer entry point, in a thread that only subscribes;
+    # messages are handled in this thread by broker.drain()
+    payment.create_transport = lambda: bench_transport('payment')
+    email.create_transport = lambda: bench_transport('email')
+    consumers = [
+        (payment.start_consuming, ()),
+        (email.start_consuming, ()),
+        (inventory.run_consumer, (bench_transport('inventory'),)),
+        (merchant.run_sales_consumer, (bench_transport('merchant'),)),
+    ]
+
+    profiler = cProfile.Profile() if args.profile else None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for target, target_args in consumers:
+            threading.Thread(target=target, args=target_args, daemon=True).start()
+        for _ in consumers:
+            if not subscribed.acquire(timeout=30):
+                parser.exit(1, "A consumer did not start\n")
+
+        for queue, body in stream:
+            if queue in events.ROUTES:
+                events.publish_event(broker, queue, body)
+            else:
+                broker.publish(queue, *events.encode_event(events.event_type_of(queue), body))
+
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        delivered = broker.drain()
+        if profiler:
+            profiler.disable()
+        wall = time.perf_counter() - start
+
+    stats.report(wall, delivered)
+    consumer = helpers['consumer']
+    queues = ['order_created', 'payment_success', 'payment_failed'] + list(email.QUEUES) + list(merchant.SALES_QUEUES)
+    retrying = sum(broker.depth(consumer.retry_queue(q, n)) for q in queues for n in range(1, consumer.MAX_ATTEMPTS))
+    dead = sum(broker.depth(consumer.dead_letter_queue(q)) for q in queues)
+    print(f"\n{retrying} message(s) waiting in retry queues, {dead} dead-lettered")
+    if profiler:
+        profiler.dump_stats(args.profile)
+        print(f"\nProfile written to {args.profile}")
+    print(f"Scratch databases in {workdir}")
+
+
+if __name__ == '__main__':
+    main()
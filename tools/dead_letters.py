@@ -0,0 +1,147 @@
+"""Inspect and replay dead-lettered messages.
+
+Each consumer queue has a <queue>.dlq holding messages that failed every
+retry (see consumer.py in the consumer services).
+
+    python tools/dead_letters.py stats
+    python tools/dead_letters.py list order_created --limit 20
+    python tools/dead_letters.py replay order_created
+    python tools/dead_letters.py purge email.payment_failed
+
+Connects to RABBITMQ_URL (host name or amqp:// URL, default localhost).
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from urllib.parse import urlparse
+
+import pika
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'PaymentService', 'app'))
+
+from consumer import (  # noqa: E402
+    ATTEMPTS_HEADER, ERROR_HEADER, FAILED_AT_HEADER, ORIGINAL_QUEUE_HEADER, dead_letter_queue
+)
+from events import ROUTES, decode_event  # noqa: E402
+
+CONSUMER_QUEUES = [queue for routes in ROUTES.values() for queue in routes]
+# Headers that describe the failed attempts; dropped on replay so the message starts over
+FAILURE_HEADERS = (ATTEMPTS_HEADER, ERROR_HEADER, FAILED_AT_HEADER, ORIGINAL_QUEUE_HEADER, 'x-death')
+
+
+def connect():
+    url = os.getenv('RABBITMQ_URL', 'localhost')
+    host = urlparse(url).hostname if '://' in url else url
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=host, port=5672))
+    return connection, connection.channel()
+
+
+def depth(channel, queue):
+    return channel.queue_declare(queue=queue, passive=True).method.message_count
+
+
+def describe(body, props):
+    headers = props.headers or {}
+    failed_at = headers.get(FAILED_AT_HEADER)
+    try:
+        event = decode_event(body, {'content_type': props.content_type, 'headers': headers})
+    except ValueError:
+        event = body[:200]
+    return (
+        f"attempts={headers.get(ATTEMPTS_HEADER)} "
+        f"failed_at={datetime.fromtimestamp(failed_at).isoformat() if failed_at else '-'} "
+        f"correlation_id={headers.get('x-correlation-id', '-')}\n"
+        f"  error: {headers.get(ERROR_HEADER)}\n"
+        f"  event: {event}"
+    )
+
+
+def cmd_stats(channel, args):
+    print(f"{'queue':<28}{'waiting':>10}{'dead letters':>14}")
+    for queue in CONSUMER_QUEUES:
+        try:
+            print(f"{queue:<28}{depth(channel, queue):>10}{depth(channel, dead_letter_queue(queue)):>14}")
+        except pika.exceptions.ChannelClosedByBroker:
+            # Not declared yet; passive declare closes the channel
+            channel = channel.connection.channel()
+            print(f"{queue:<28}{'-':>10}{'-':>14}")
+
+
+def cmd_list(channel, args):
+    dlq = dead_letter_queue(args.queue)
+    last_tag = None
+    for index in range(args.limit):
+        method, props, body = channel.basic_get(queue=dlq, auto_ack=False)
+        if method is None:
+            break
+        last_tag = method.delivery_tag
+        print(f"[{index}] {describe(body, props)}")
+    if last_tag is None:
+        print(f"{dlq} is empty")
+    else:
+        # Put everything back where it was
+        channel.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+
+
+def cmd_replay(channel, args):
+    dlq = dead_letter_queue(args.queue)
+    channel.confirm_delivery()
+    # Only what is there now: a message that fails again straight away comes
+    # back to the DLQ and must not be replayed in a loop
+    limit = depth(channel, dlq)
+    if args.limit is not None:
+        limit = min(limit, args.limit)
+    replayed = 0
+    while replayed < limit:
+        method, props, body = channel.basic_get(queue=dlq, auto_ack=False)
+        if method is None:
+            break
+        headers = {k: v for k, v in (props.headers or {}).items() if k not in FAILURE_HEADERS}
+        target = (props.headers or {}).get(ORIGINAL_QUEUE_HEADER, args.queue)
+        channel.basic_publish(
+            exchange='',
+            routing_key=target,
+            body=body,
+            properties=pika.BasicProperties(content_type=props.content_type, headers=headers, delivery_mode=2)
+        )
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        replayed += 1
+    print(f"Replayed {replayed} message(s) from {dlq}")
+
+
+def cmd_purge(channel, args):
+    dlq = dead_letter_queue(args.queue)
+    if not args.yes:
+        answer = input(f"Delete all {depth(channel, dlq)} message(s) in {dlq}? [y/N] ")
+        if answer.strip().lower() != 'y':
+            return
+    purged = channel.queue_purge(queue=dlq).method.message_count
+    print(f"Purged {purged} message(s) from {dlq}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='queue and dead-letter depth per consumer queue')
+    list_parser = commands.add_parser('list', help='show dead letters without removing them')
+    list_parser.add_argument('queue')
+    list_parser.add_argument('--limit', type=int, default=10)
+    replay_parser = commands.add_parser('replay', help='move dead letters back to their queue')
+    replay_parser.add_argument('queue')
+    replay_parser.add_argument('--limit', type=int)
+    purge_parser = commands.add_parser('purge', help='delete dead letters')
+    purge_parser.add_argument('queue')
+    purge_parser.add_argument('--yes', action='store_true')
+    args = parser.parse_args(argv)
+
+    connection, channel = connect()
+    try:
+        {'stats': cmd_stats, 'list': cmd_list, 'replay': cmd_replay, 'purge': cmd_purge}[args.command](channel, args)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
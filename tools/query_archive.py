@@ -0,0 +1,71 @@
+"""Query archived order or payment partitions offline.
+
+Archives are gzipped NDJSON, one row per line in id order. Matching rows are
+printed as NDJSON, or counted with --count.
+
+    python tools/query_archive.py OrderService/archive/orders_202401.ndjson.gz --id 1234
+    python tools/query_archive.py OrderService/archive/*.ndjson.gz --where merchantId=3 --from 2024-01-01 --to 2024-02-01
+    python tools/query_archive.py PaymentService/archive/*.ndjson.gz --where success=0 --count
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'OrderService'))
+
+from app.partitions import find_in_archive, scan_archive  # noqa: E402
+
+
+def parse_where(items):
+    """field=value pairs; values are compared as JSON when they parse, else as text"""
+    filters = {}
+    for item in items:
+        field, sep, value = item.partition('=')
+        if not sep:
+            raise SystemExit(f"--where expects field=value, got {item!r}")
+        try:
+            filters[field] = json.loads(value)
+        except ValueError:
+            filters[field] = value
+    return filters
+
+
+def matches(row, filters, start, end):
+    if any(row.get(field) != value for field, value in filters.items()):
+        return False
+    created_at = row.get('created_at') or ''
+    return (start is None or created_at >= start) and (end is None or created_at < end)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='archive files (*.ndjson.gz)')
+    parser.add_argument('--id', type=int, help='a single row by id')
+    parser.add_argument('--where', action='append', default=[], metavar='FIELD=VALUE')
+    parser.add_argument('--from', dest='start', help='created_at >= this (YYYY-MM-DD[ HH:MM:SS], UTC)')
+    parser.add_argument('--to', dest='end', help='created_at < this')
+    parser.add_argument('--count', action='store_true', help='print the number of matches only')
+    args = parser.parse_args(argv)
+
+    filters = parse_where(args.where)
+    count = 0
+    for path in args.paths:
+        if args.id is not None:
+            row = find_in_archive(path, args.id)
+            rows = [row] if row is not None else []
+        else:
+            rows = scan_archive(path)
+        for row in rows:
+            if not matches(row, filters, args.start, args.end):
+                continue
+            count += 1
+            if not args.count:
+                print(json.dumps(row))
+    if args.count:
+        print(count)
+
+
+if __name__ == '__main__':
+    main()
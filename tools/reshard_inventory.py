@@ -0,0 +1,148 @@
+"""Change the number of InventoryService shard files, offline.
+
+Stop InventoryService first. Every product is copied, with its id, into the
+shard its id maps to under the new count, and the record of payment events
+already applied goes to every new shard. The old files are then moved to
+pre-reshard-<timestamp>/ in the data directory and the new ones take their
+place. Start the service again with INVENTORY_SHARDS set to the new count.
+
+    python tools/reshard_inventory.py --data-dir InventoryService --to 4
+    python tools/reshard_inventory.py --data-dir InventoryService --to 1
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'InventoryService'))
+
+from app.shards import ShardLayoutError, create_schema, detect_shard_count, shard_index, shard_path  # noqa: E402
+
+BATCH_SIZE = 5000
+
+
+def checkpoint(path):
+    """Fold the WAL into the main file so the file alone is the whole shard"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+
+def copy_products(sources, targets, new_count):
+    columns = None
+    copied = [0] * new_count
+    for source in sources:
+        conn = sqlite3.connect(source)
+        cursor = conn.execute('SELECT * FROM products ORDER BY id')
+        if columns is None:
+            columns = [c[0] for c in cursor.description]
+            insert = f"INSERT INTO products ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            by_shard = {}
+            for row in rows:
+                by_shard.setdefault(shard_index(row[0], new_count), []).append(row)
+            for index, shard_rows in by_shard.items():
+                targets[index].executemany(insert, shard_rows)
+                copied[index] += len(shard_rows)
+        conn.close()
+    for target in targets:
+        target.commit()
+    return copied
+
+
+def copy_processed_events(sources, targets):
+    """Copy the applied payment events into every new shard.
+
+    The rows don't say which product they were for, and a redelivered event
+    must still be skipped by whichever shard now holds its product.
+    """
+    copied = 0
+    insert = 'INSERT OR IGNORE INTO processed_payment_events (eventType, orderId, processedAt) VALUES (?, ?, ?)'
+    for source in sources:
+        conn = sqlite3.connect(source)
+        has_table = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'processed_payment_events'"
+        ).fetchone()
+        if has_table:
+            cursor = conn.execute('SELECT eventType, orderId, processedAt FROM processed_payment_events')
+            while True:
+                rows = cursor.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                for target in targets:
+                    target.executemany(insert, rows)
+                copied += len(rows)
+        conn.close()
+    for target in targets:
+        target.commit()
+    return copied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='.', help='directory holding the inventory database files')
+    parser.add_argument('--to', type=int, required=True, help='new shard count')
+    args = parser.parse_args(argv)
+    if args.to < 1:
+        parser.error('--to must be at least 1')
+
+    try:
+        old_count = detect_shard_count(args.data_dir)
+    except ShardLayoutError as e:
+        raise SystemExit(str(e))
+    if old_count == args.to:
+        print(f"Already {old_count} shard(s), nothing to do")
+        return
+    sources = [shard_path(i, old_count, args.data_dir) for i in range(old_count)]
+    for source in sources:
+        if not os.path.exists(source):
+            raise SystemExit(f"Missing shard {source}")
+        checkpoint(source)
+
+    staging = os.path.join(args.data_dir, f'reshard-{int(time.time())}')
+    os.makedirs(staging)
+    targets = []
+    for index in range(args.to):
+        conn = sqlite3.connect(shard_path(index, args.to, staging))
+        create_schema(conn, index, args.to)
+        targets.append(conn)
+
+    start = time.perf_counter()
+    copied = copy_products(sources, targets, args.to)
+    events = copy_processed_events(sources, targets)
+    for target in targets:
+        target.close()
+
+    expected = 0
+    for source in sources:
+        conn = sqlite3.connect(source)
+        expected += conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+        conn.close()
+    if sum(copied) != expected:
+        raise SystemExit(f"Copied {sum(copied)} products but the old shards hold {expected}; left {staging} in place")
+
+    backup = os.path.join(args.data_dir, f'pre-reshard-{int(time.time())}')
+    os.makedirs(backup)
+    for source in sources:
+        for path in (source, source + '-wal', source + '-shm'):
+            if os.path.exists(path):
+                shutil.move(path, backup)
+    for index in range(args.to):
+        shutil.move(shard_path(index, args.to, staging), shard_path(index, args.to, args.data_dir))
+    os.rmdir(staging)
+
+    print(f"Resharded {expected} products from {old_count} to {args.to} shard(s) in {time.perf_counter() - start:.2f}s")
+    print(f"Copied {events} applied payment events to every shard")
+    for index, count in enumerate(copied):
+        print(f"  {shard_path(index, args.to, args.data_dir)}: {count}")
+    print(f"Old files are in {backup}. Start InventoryService with INVENTORY_SHARDS={args.to}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Rebuild, optimize or check the InventoryService product search index.
+
+The index is kept in sync by triggers; rebuild it after editing shard files
+by hand or if `check` reports a problem. Safe to run while the service is up.
+
+    python tools/search_index.py rebuild --data-dir InventoryService
+    python tools/search_index.py optimize --data-dir InventoryService
+    python tools/search_index.py check --data-dir InventoryService
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'InventoryService'))
+
+from app.shards import ShardLayoutError, detect_shard_count, rebuild_search_index, shard_path  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['rebuild', 'optimize', 'check'])
+    parser.add_argument('--data-dir', default='.', help='directory holding the inventory database files')
+    args = parser.parse_args(argv)
+
+    try:
+        count = detect_shard_count(args.data_dir)
+    except ShardLayoutError as e:
+        raise SystemExit(str(e))
+
+    failed = False
+    for index in range(count):
+        path = shard_path(index, count, args.data_dir)
+        conn = sqlite3.connect(path, timeout=30)
+        start = time.perf_counter()
+        try:
+            if args.command == 'rebuild':
+                rebuild_search_index(conn)
+            elif args.command == 'optimize':
+                conn.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+                conn.commit()
+            else:
+                conn.execute("INSERT INTO products_fts (products_fts) VALUES ('integrity-check')")
+        except sqlite3.DatabaseError as e:
+            failed = True
+            print(f"{path}: {e}")
+            continue
+        finally:
+            conn.close()
+        print(f"{path}: {args.command} ok in {time.perf_counter() - start:.2f}s")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
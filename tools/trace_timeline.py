@@ -0,0 +1,119 @@
+"""Rebuild per-order timelines from the services' JSON-lines span files.
+
+    python tools/trace_timeline.py traces/*.jsonl
+    python tools/trace_timeline.py traces/*.jsonl --cid 3f2a...
+
+Without --cid it prints where end-to-end time goes across order traces
+(those with a POST /orders span): queueing (time messages sat in RabbitMQ)
+versus processing (the entry request plus every consumer), and per-stage
+latency. Rotated files (*.jsonl.1, ...) can be passed too.
+"""
+import argparse
+import json
+import sys
+
+ORDER_SPAN = 'POST /orders'
+
+
+def load_spans(paths):
+    traces = {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partially written line
+                traces.setdefault(record['cid'], []).append(record)
+    for spans in traces.values():
+        spans.sort(key=lambda s: (s['start'], -s['end']))
+    return traces
+
+
+def is_order_trace(spans):
+    return any(s['name'] == ORDER_SPAN for s in spans)
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def breakdown(spans):
+    """Return (end_to_end, queueing, processing) in seconds for one trace"""
+    root = spans[0]
+    end_to_end = max(s['end'] for s in spans) - root['start']
+    queueing = sum(s['end'] - s['start'] for s in spans if s['kind'] == 'queue')
+    processing = (root['end'] - root['start']) + sum(
+        s['end'] - s['start'] for s in spans if s['kind'] == 'consume'
+    )
+    return end_to_end, queueing, processing
+
+
+def print_timeline(cid, spans, out=sys.stdout):
+    origin = spans[0]['start']
+    print(f"trace {cid}", file=out)
+    print(f"{'offset ms':>10}{'dur ms':>10}  {'service':<20}{'kind':<9}name", file=out)
+    for s in spans:
+        print(
+            f"{(s['start'] - origin) * 1000:>10.1f}{(s['end'] - s['start']) * 1000:>10.1f}  "
+            f"{s['service']:<20}{s['kind']:<9}{s['name']}",
+            file=out
+        )
+    end_to_end, queueing, processing = breakdown(spans)
+    print(f"\nend-to-end {end_to_end * 1000:.1f} ms, queueing {queueing * 1000:.1f} ms, "
+          f"processing {processing * 1000:.1f} ms", file=out)
+
+
+def print_summary(traces, out=sys.stdout):
+    # Lookups and other single requests would skew the per-order numbers
+    skipped = len(traces)
+    traces = {cid: spans for cid, spans in traces.items() if is_order_trace(spans)}
+    skipped -= len(traces)
+    totals = [breakdown(spans) for spans in traces.values()]
+    end_to_end = sorted(t[0] for t in totals)
+    queueing = sum(t[1] for t in totals)
+    processing = sum(t[2] for t in totals)
+    overall = queueing + processing or 1.0
+
+    print(f"{len(traces)} order traces ({skipped} other traces skipped)", file=out)
+    print(f"end-to-end p50 {percentile(end_to_end, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(end_to_end, 99) * 1000:.1f} ms", file=out)
+    print(f"queueing {queueing / overall:.0%} / processing {processing / overall:.0%} of measured time\n", file=out)
+
+    stages = {}
+    for spans in traces.values():
+        for s in spans:
+            stages.setdefault((s['service'], s['kind'], s['name']), []).append(s['end'] - s['start'])
+    print(f"{'service':<20}{'kind':<9}{'stage':<36}{'count':>8}{'mean ms':>10}{'p99 ms':>10}", file=out)
+    for (service, kind, name), durations in sorted(stages.items(), key=lambda i: -sum(i[1])):
+        durations.sort()
+        print(
+            f"{service:<20}{kind:<9}{name:<36}{len(durations):>8}"
+            f"{sum(durations) / len(durations) * 1000:>10.1f}{percentile(durations, 99) * 1000:>10.1f}",
+            file=out
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='span files written by the services (TRACE_FILE)')
+    parser.add_argument('--cid', help='print the timeline of one correlation id')
+    args = parser.parse_args(argv)
+
+    traces = load_spans(args.files)
+    if args.cid:
+        if args.cid not in traces:
+            parser.exit(1, f"No spans for correlation id {args.cid}\n")
+        print_timeline(args.cid, traces[args.cid])
+    else:
+        print_summary(traces)
+
+
+if __name__ == '__main__':
+    main()